@@ -1,11 +1,49 @@
-from gfxlib.utils import init_fonts, get_new_font
+from os import environ
+
+from gfxlib.utils import init_fonts, get_new_font, get_bitmap_font
 from obd.config import init_config_env
 
+USE_BITMAP_FONTS = environ.get('CARPI_UI_BITMAP_FONTS', None) == '1'
+
 init_fonts()
-FONTS = {
-    'default': get_new_font('10x20', 20),
-    'med': get_new_font('6x10', 10),
-    'small': get_new_font('5x8', 8)
-}
+if USE_BITMAP_FONTS:
+    FONTS = {
+        'default': get_bitmap_font('10x20'),
+        'med': get_bitmap_font('6x10'),
+        'small': get_bitmap_font('5x8')
+    }
+else:
+    FONTS = {
+        'default': get_new_font('10x20', 20),
+        'med': get_new_font('6x10', 10),
+        'small': get_new_font('5x8', 8)
+    }
 
 CONFIG = init_config_env('CARPI_UI_CONFIG', ['ui.conf', '/etc/carpi/ui.conf'])
+
+_TELEMETRY = None
+
+
+def get_telemetry():
+    """
+    Returns the shared telemetry worker, starting it on first use.
+    The Redis client is only imported here, keeping it off the startup path.
+    :return TelemetryWorker:
+    """
+    global _TELEMETRY
+    if not _TELEMETRY:
+        from obd.redis import get_redis, get_notification_mode
+        from obd.telemetry import TelemetryWorker
+        _TELEMETRY = TelemetryWorker(get_redis(CONFIG), notifications=get_notification_mode(CONFIG))
+        _TELEMETRY.start()
+    return _TELEMETRY
+
+
+def set_telemetry(worker):
+    """
+    Replaces the shared telemetry worker, e.g. with one reading from a
+    stand-in Redis. Has to be called before any screen is created.
+    :param TelemetryWorker worker:
+    """
+    global _TELEMETRY
+    _TELEMETRY = worker
@@ -7,7 +7,7 @@ from app import FONTS
 from app.fuel_stats import FuelStatsScreen
 from gfxlib.objects import Screen, Label, TEXT_ALIGN_CENTER, TEXT_VALIGN_CENTER, TEXT_VALIGN_BOTTOM, GfxApp, FileImage, \
     IMAGE_RMODE_RENDER_NON_ALPHA, TEXT_ALIGN_RIGHT
-from gfxhat.touch import set_led
+from gfxlib.peripherals import get_peripherals
 
 BOOT_FRAMES = [
     [0, 0, 0, 0, 0, 0],
@@ -75,6 +75,6 @@ class BootScreen(Screen):
 
         frame_i = ceil(delta / 0.2) % len(BOOT_FRAMES)
         frame = BOOT_FRAMES[frame_i]
-        for i in range(len(frame)):
-            set_led(i, frame[i])
+        # Only LEDs that changed since the last frame get written
+        get_peripherals().set_leds(frame)
 
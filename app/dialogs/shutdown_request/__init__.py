@@ -3,8 +3,10 @@ from gfxlib.objects import GfxApp
 
 
 class ShutdownRequestDialog(QuestionDialog):
+    ID = 'dialog-shutdown'
+
     def __init__(self):
-        super().__init__('dialog-shutdown', 'SHUTDOWN',
+        super().__init__(ShutdownRequestDialog.ID, 'SHUTDOWN',
                          'Shutdown\ndevice?',
                          'YES', 'NO')
 
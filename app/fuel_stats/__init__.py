@@ -1,18 +1,16 @@
 from datetime import datetime
 from os.path import join, dirname
 
-from PIL import ImageDraw, Image
-from gfxhat import touch, backlight
 from math import ceil
 
-from app import CONFIG, FONTS
-from app.value_display import _new_label, _new_value_label, ValueDisplayScreen, SPEED_OFFSET_FACTOR
+from app import FONTS, get_telemetry
+from app.value_display import _new_label, _new_value_label, ValueDisplayScreen, SPEED_OFFSET_FACTOR, ACTIVE_FPS, \
+    PARKED_FPS
 from gfxlib.objects import Screen, Line, SpinnerLabel, TEXT_ALIGN_RIGHT, BarGraph, Label, TEXT_VALIGN_BOTTOM, GfxApp, \
     OverlayDialog
+from gfxlib.peripherals import get_peripherals, BlinkPattern
 from obd import ObdRedisKeys
-from obd.redis import get_redis, get_piped
 from obd.work import calculate_fuel_usage, calculate_fuel_efficiency
-from utils import try_int
 
 MY_DIR = dirname(__file__)
 RES_DIR = join(MY_DIR, 'res')
@@ -28,6 +26,10 @@ R_KEYS = [
 
 LP100K_BREAK_POINT = 30
 
+BACKLIGHT_DEFAULT = (255, 0, 0)
+# Backlight flashing while the Check Engine dialog is shown
+DTC_BLINK = BlinkPattern([(255, 100, 100), BACKLIGHT_DEFAULT], 1.0)
+
 
 class FuelStatsScreen(Screen):
     ID = 'fuel-stats'
@@ -35,7 +37,8 @@ class FuelStatsScreen(Screen):
     def __init__(self):
         super().__init__(FuelStatsScreen.ID)
 
-        self._redis = get_redis(CONFIG)
+        self._telemetry = get_telemetry()
+        self._telemetry.watch(R_KEYS)
 
         self.add_object(Line((0, 8), (128, 8)))
 
@@ -92,40 +95,52 @@ class FuelStatsScreen(Screen):
         lph = None
         lp100k = None
 
-        try:
-            data = get_piped(self._redis, R_KEYS)
-            state = try_int(data[ObdRedisKeys.KEY_ALIVE])
-            self.set_status(ValueDisplayScreen.get_status_text(state))
-
-            if state == 1 or state == 10:
-                has_dtcs = data[ObdRedisKeys.KEY_MIL_STATUS].decode('utf-8') == str(True)
-                spd = ceil(try_int(data[ObdRedisKeys.KEY_VEHICLE_SPEED], 0) * SPEED_OFFSET_FACTOR)
-                rpm = try_int(data[ObdRedisKeys.KEY_ENGINE_RPM])
-                intmp = try_int(data[ObdRedisKeys.KEY_INTAKE_TEMP])
-                inmap = try_int(data[ObdRedisKeys.KEY_INTAKE_MAP])
-
-                lph = min(calculate_fuel_usage(rpm, inmap, intmp, 0.85, 1.390, 745), 99.9)
-                lp100k = min(calculate_fuel_efficiency(spd, lph), 99.9) if spd > 0 else 0
-        except:
-            self.set_status('DATA ERR')
+        snapshot = self._telemetry.snapshot
+        data = snapshot.decoded
+        if data is None and snapshot.error is None:
+            # No read has completed yet
+            self.set_status('AWAIT INIT')
+            self.target_fps = PARKED_FPS
+        else:
+            # A failed read has no decoded values, ending up as DATA ERR
+            try:
+                state = data.state
+                self.set_status(ValueDisplayScreen.get_status_text(state))
+                self.target_fps = ACTIVE_FPS if state == 1 or state == 10 else PARKED_FPS
+
+                if state == 1 or state == 10:
+                    has_dtcs = data.mil
+                    spd = ceil((data.speed or 0) * SPEED_OFFSET_FACTOR)
+                    rpm = data.rpm
+                    intmp = data.intake_temp
+                    inmap = data.intake_map
+
+                    lph = min(calculate_fuel_usage(rpm, inmap, intmp, 0.85, 1.390, 745), 99.9)
+                    lp100k = min(calculate_fuel_efficiency(spd, lph), 99.9) if spd > 0 else 0
+            except:
+                self.set_status('DATA ERR')
+                self.target_fps = PARKED_FPS
 
         self.set_fuel_ecp(lph, lp100k, spd)
         self.set_rpm(rpm)
         self.set_spd(spd)
         self.set_dtcs(has_dtcs)
+        self._update_backlight()
 
         self._dtc_indicator.is_visible = self._had_dtcs and now.second % 2 == 0
 
         super().update(now, app)
 
-    def _render(self, draw: ImageDraw.ImageDraw, image: Image.Image):
-        super()._render(draw, image)
+    def _update_backlight(self):
+        peripherals = get_peripherals()
         if self._dtc_dialog.is_visible:
-            blink = datetime.now().second % 2 == 0
-            backlight.set_all(255, 100 if blink else 0, 100 if blink else 0)
+            peripherals.set_backlight_pattern(DTC_BLINK)
         else:
-            backlight.set_all(255, 0, 0)
-        backlight.show()
+            peripherals.set_backlight(*BACKLIGHT_DEFAULT)
+
+    def on_navigate_away(self, to_screen: str = None):
+        super().on_navigate_away(to_screen)
+        get_peripherals().set_backlight(*BACKLIGHT_DEFAULT)
 
     def set_status(self, status: str):
         self._status_label.text = status
@@ -2,15 +2,17 @@ from datetime import datetime
 
 from PIL import ImageDraw
 from PIL.Image import Image
-from gfxhat.touch import set_led
 
 from app import FONTS
 from gfxlib.objects import Screen, GfxApp, Label, TEXT_ALIGN_CENTER, TEXT_VALIGN_CENTER
+from gfxlib.peripherals import get_peripherals
 
 SCREEN_ID = 'shutdown'
 
 
 class ShutdownScreen(Screen):
+    ID = SCREEN_ID
+
     def __init__(self):
         super().__init__(SCREEN_ID)
 
@@ -22,8 +24,7 @@ class ShutdownScreen(Screen):
         self._has_rendered = False
 
     def on_navigate_to(self, from_screen: str = None):
-        for i in range(6):
-            set_led(i, 0)
+        get_peripherals().set_leds([0] * 6)
         self._has_rendered = False
 
     def _render(self, draw: ImageDraw.ImageDraw, image: Image):
@@ -6,6 +6,9 @@ from math import floor
 from app import FONTS
 from gfxlib.objects import Screen, Line, Label, TEXT_ALIGN_CENTER, ArrayImage, Rectangle, GfxApp
 
+# Menus only change on input, which wakes up the pipeline anyway
+MENU_FPS = 1
+
 IMG_ARROW_UP = [
     [0, 0, 0, 0, 0, 0, 0],
     [0, 0, 0, 0, 0, 0, 0],
@@ -33,6 +36,7 @@ class BaseMenu(Screen):
         super().__init__(screen_id)
 
         self._selection_pos = 0
+        self.target_fps = MENU_FPS
 
         self._menu_items = menu_items
         self._menu_actions = actions
@@ -6,6 +6,9 @@ from gfxlib.objects import Screen, Line, Label, TEXT_ALIGN_CENTER, FileImage, IM
 MY_DIR = dirname(__file__)
 RES_DIR = join(MY_DIR, 'res')
 
+# Dialogs only change on input, which wakes up the pipeline anyway
+DIALOG_FPS = 1
+
 
 class QuestionDialog(Screen):
     def __init__(self,
@@ -29,6 +32,7 @@ class QuestionDialog(Screen):
                          Label((35, 12), FONTS['med'], question)
                          )
         self._source_screen = None
+        self.target_fps = DIALOG_FPS
 
     def on_navigate_to(self, from_screen: str = None):
         self._source_screen = from_screen
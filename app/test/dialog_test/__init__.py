@@ -9,8 +9,10 @@ RES_DIR = join(MY_DIR, 'res')
 
 
 class DialogTestScreen(Screen):
+    ID = 'test-dialog'
+
     def __init__(self):
-        super().__init__('test-dialog')
+        super().__init__(DialogTestScreen.ID)
 
         # Background
         self.add_objects(Line((0, 0), (127, 63)),
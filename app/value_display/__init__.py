@@ -3,12 +3,10 @@ from typing import Tuple
 
 from math import ceil
 
-from app import FONTS, CONFIG
+from app import FONTS, get_telemetry
 from gfxlib.objects import Screen, Label, TEXT_ALIGN_RIGHT, Line, SpinnerLabel, \
     GfxApp, TEXT_VALIGN_BOTTOM
 from obd import ObdRedisKeys
-from obd.redis import get_redis, get_piped
-from utils import try_int
 
 R_KEYS = [
     ObdRedisKeys.KEY_ALIVE,
@@ -22,6 +20,10 @@ R_KEYS = [
 
 SPEED_OFFSET_FACTOR = 1.03
 
+# Frame rates while the OBD source delivers data / while the car is parked
+ACTIVE_FPS = 10
+PARKED_FPS = 1
+
 
 def _new_label(xy: Tuple[int, int], text: str) -> Label:
     return Label(xy, FONTS['small'], text)
@@ -75,39 +77,50 @@ class ValueDisplayScreen(Screen):
                          self._fuel_status_1,
                          self._fuel_status_2)
 
-        self._redis = get_redis(CONFIG)
+        self._telemetry = get_telemetry()
+        self._telemetry.watch(R_KEYS)
 
     def update(self, now: datetime, app):
-        try:
-            data = get_piped(self._redis, R_KEYS)
-            state = try_int(data[ObdRedisKeys.KEY_ALIVE])
-            self.set_status(ValueDisplayScreen.get_status_text(state))
-
-            spd = 0
-            rpm = 0
-            intmp = 0
-            inmap = 0
-            fuel_st1 = 0
-            fuel_st2 = 0
-
-            if state == 1 or state == 10:
-                spd = try_int(data[ObdRedisKeys.KEY_VEHICLE_SPEED])
-                rpm = try_int(data[ObdRedisKeys.KEY_ENGINE_RPM])
-                intmp = try_int(data[ObdRedisKeys.KEY_INTAKE_TEMP])
-                inmap = try_int(data[ObdRedisKeys.KEY_INTAKE_MAP])
-                fuel_st1 = try_int(data[ObdRedisKeys.KEY_FUELSYS_1_STATUS])
-                fuel_st2 = try_int(data[ObdRedisKeys.KEY_FUELSYS_2_STATUS])
-            else:
-                pass
-
-            self.set_speed(ceil(spd * SPEED_OFFSET_FACTOR))
-            self.set_rpm(rpm)
-            self.set_intake_temp(intmp)
-            self.set_intake_map(inmap)
-            self.set_fuel_status_1(fuel_st1)
-            self.set_fuel_status_2(fuel_st2)
-        except:
-            self.set_status('DATA ERR')
+        snapshot = self._telemetry.snapshot
+        data = snapshot.decoded
+        if data is None and snapshot.error is None:
+            # No read has completed yet
+            self.set_status('AWAIT INIT')
+            self.target_fps = PARKED_FPS
+        else:
+            # A failed read has no decoded values, ending up as DATA ERR
+            try:
+                state = data.state
+                self.set_status(ValueDisplayScreen.get_status_text(state))
+
+                spd = 0
+                rpm = 0
+                intmp = 0
+                inmap = 0
+                fuel_st1 = 0
+                fuel_st2 = 0
+
+                self.target_fps = ACTIVE_FPS if state == 1 or state == 10 else PARKED_FPS
+
+                if state == 1 or state == 10:
+                    spd = data.speed
+                    rpm = data.rpm
+                    intmp = data.intake_temp
+                    inmap = data.intake_map
+                    fuel_st1 = data.fuel_system_1_status
+                    fuel_st2 = data.fuel_system_2_status
+                else:
+                    pass
+
+                self.set_speed(ceil(spd * SPEED_OFFSET_FACTOR))
+                self.set_rpm(rpm)
+                self.set_intake_temp(intmp)
+                self.set_intake_map(inmap)
+                self.set_fuel_status_1(fuel_st1)
+                self.set_fuel_status_2(fuel_st2)
+            except:
+                self.set_status('DATA ERR')
+                self.target_fps = PARKED_FPS
 
         super().update(now, app)
 
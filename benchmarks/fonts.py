@@ -0,0 +1,59 @@
+"""
+Compares text rendering through FreeType with the BDF glyph atlas,
+with and without the mask cache of the atlas.
+
+Usage: python3 -m benchmarks.fonts [<iterations>]
+"""
+from sys import argv
+from timeit import timeit
+
+from PIL import Image, ImageDraw
+
+from gfxlib.fonts import BitmapFont
+from gfxlib.utils import init_fonts, get_font, get_new_font, get_bitmap_font
+
+FONT_SIZES = [
+    ('10x20', 20),
+    ('6x10', 10),
+    ('5x8', 8)
+]
+
+SAMPLE_TEXTS = [
+    'Speed',
+    '1234',
+    '!ENGINE!',
+    'Check\nEngine!',
+    '(C)2019, rGunti'
+]
+
+
+def _bench_font(font, iterations: int):
+    image = Image.new('P', (128, 64))
+    draw = ImageDraw.Draw(image)
+
+    def measure():
+        for text in SAMPLE_TEXTS:
+            draw.textbbox((0, 0), text=text, font=font)
+
+    def render():
+        for text in SAMPLE_TEXTS:
+            draw.text(xy=(0, 0), text=text, fill=1, font=font)
+
+    count = iterations * len(SAMPLE_TEXTS)
+    return (timeit(measure, number=iterations) / count * 1000000,
+            timeit(render, number=iterations) / count * 1000000)
+
+
+def run(iterations: int = 2000):
+    init_fonts()
+    print('{:<8} {:<10} {:>12} {:>12}'.format('Font', 'Renderer', 'Measure [us]', 'Render [us]'))
+    for key, size in FONT_SIZES:
+        for name, font in [('FreeType', get_new_font(key, size)),
+                           ('Atlas', get_bitmap_font(key)),
+                           ('Uncached', BitmapFont(get_font(key), mask_cache_size=0))]:
+            measure, render = _bench_font(font, iterations)
+            print('{:<8} {:<10} {:>12.1f} {:>12.1f}'.format(key, name, measure, render))
+
+
+if __name__ == '__main__':
+    run(int(argv[1]) if len(argv) > 1 else 2000)
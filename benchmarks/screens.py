@@ -0,0 +1,271 @@
+"""
+Renders every shipped screen through RenderPipeline.loop_step on the
+headless backend, for each orientation and modifier combination, with
+the telemetry read from a stand-in Redis.
+
+Every frame is forced to be redrawn (the app gets invalidated before
+each step) and frame pacing is disabled, so the frame rate reflects the
+cost of the pipeline itself.
+
+Frame rates depend on the machine, so no baseline is shipped. Record
+one on the machine the check runs on before the first check:
+
+    python3 -m benchmarks.screens --update-baseline
+
+Without a baseline the check exits with status 2 instead of passing.
+
+Usage: python3 -m benchmarks.screens [--frames N] [--output FILE]
+                                     [--baseline FILE] [--update-baseline]
+                                     [--tolerance PCT] [--screen ID ...]
+"""
+from argparse import ArgumentParser
+from json import dump, load
+from os import environ
+from os.path import dirname, join, exists
+from platform import python_version, machine
+from sys import exit
+from time import perf_counter_ns
+
+environ.setdefault('CARPI_UI_BACKEND', 'headless')
+
+from PIL import __version__ as pillow_version
+
+from gfxlib import pipeline
+from gfxlib.backend import get_backend
+from gfxlib.objects import GfxApp
+from gfxlib.scheduler import FrameScheduler, NS_PER_SECOND
+from obd import ObdRedisKeys
+from obd.redis import get_snapshot_cache
+from obd.telemetry import TelemetryWorker
+
+DEFAULT_FRAMES = 200
+DEFAULT_TOLERANCE = 10.0
+DEFAULT_BASELINE = join(dirname(__file__), 'screens_baseline.json')
+
+ORIENTATIONS = {
+    'landscape': pipeline.ORIENT_LANDSCAPE,
+    'landscape-invert': pipeline.ORIENT_LANDSCAPE_INVERT,
+    'portrait': pipeline.ORIENT_PORTRAIT,
+    'portrait-invert': pipeline.ORIENT_PORTRAIT_INVERT
+}
+
+MODIFIERS = {
+    'none': pipeline.MODIFIER_NONE,
+    'inverted': pipeline.MODIFIER_COLOR_INVERTED,
+    'diff': pipeline.MODIFIER_DRAW_IN_DIFF_MODE,
+    'inverted+diff': pipeline.MODIFIER_COLOR_INVERTED | pipeline.MODIFIER_DRAW_IN_DIFF_MODE
+}
+
+
+class StandInRedis(object):
+    """
+    Answers the GET pipelines of the telemetry worker with values of a
+    car driving around, changing with every call to advance()
+    """
+
+    def __init__(self):
+        self._frame = 0
+        self._values = {}
+        # Gives the stand-in a snapshot cache of its own
+        self.connection_pool = object()
+        self.advance()
+
+    def advance(self):
+        self._frame += 1
+        frame = self._frame
+        self._values = {
+            ObdRedisKeys.KEY_ALIVE: b'1',
+            ObdRedisKeys.KEY_VEHICLE_SPEED: str(40 + frame % 80).encode(),
+            ObdRedisKeys.KEY_ENGINE_RPM: str(1200 + (frame * 37) % 4500).encode(),
+            ObdRedisKeys.KEY_INTAKE_TEMP: str(20 + frame % 15).encode(),
+            ObdRedisKeys.KEY_INTAKE_MAP: str(30 + (frame * 7) % 70).encode(),
+            ObdRedisKeys.KEY_FUELSYS_1_STATUS: b'2',
+            ObdRedisKeys.KEY_FUELSYS_2_STATUS: b'0',
+            ObdRedisKeys.KEY_MIL_STATUS: b'False'
+        }
+
+    def pipeline(self):
+        return _StandInPipeline(self._values)
+
+
+class _StandInPipeline(object):
+    def __init__(self, values):
+        self._values = values
+        self._keys = []
+
+    def get(self, key):
+        self._keys.append(key)
+
+    def execute(self):
+        return [self._values.get(key) for key in self._keys]
+
+
+class _UnpacedScheduler(FrameScheduler):
+    """Ignores the frame rates requested by the screens"""
+
+    def set_rate(self, fps: float):
+        super().set_rate(0)
+
+
+def _create_app(redis: StandInRedis):
+    # Screens pick up the telemetry worker on creation, so they are
+    # only imported once the stand-in has been put in place
+    from app import set_telemetry
+    telemetry = TelemetryWorker(redis)
+    set_telemetry(telemetry)
+
+    from app.boot import BootScreen
+    from app.dialogs.shutdown_request import ShutdownRequestDialog
+    from app.fuel_stats import FuelStatsScreen
+    from app.menus.main import MainMenu
+    from app.templates.question import QuestionDialog
+    from app.test.dialog_test import DialogTestScreen
+    from app.value_display import ValueDisplayScreen
+
+    app = GfxApp()
+    app.add_screens([BootScreen(),
+                     FuelStatsScreen(),
+                     ValueDisplayScreen(),
+                     MainMenu(),
+                     QuestionDialog('question', 'QUESTION', 'Sample\nquestion?'),
+                     ShutdownRequestDialog(),
+                     DialogTestScreen()])
+    return app, telemetry
+
+
+def _run_case(app: GfxApp, telemetry: TelemetryWorker, redis: StandInRedis,
+              screen_id: str, orientation: int, modifiers: int, frames: int) -> dict:
+    display = get_backend().display
+    p = pipeline.RenderPipeline(app,
+                                enable_reinit=True,
+                                orientation=orientation,
+                                modifiers=modifiers,
+                                scheduler=_UnpacedScheduler())
+    app.navigate_to(screen_id)
+    bytes_before = display.total_bytes_sent
+
+    cache = get_snapshot_cache(redis)
+    elapsed = 0
+    for _ in range(frames):
+        redis.advance()
+        # The frames follow each other faster than the cache's TTL
+        cache.invalidate()
+        telemetry.poll()
+        # Screens may navigate away on their own (e.g. the boot screen)
+        if app.active_screen_id != screen_id:
+            app.navigate_to(screen_id)
+        app.invalidate()
+
+        started = perf_counter_ns()
+        p.loop_step()
+        elapsed += perf_counter_ns() - started
+
+    p.close()
+
+    timings = p.frame_time
+    return {
+        'screen': screen_id,
+        'frames': frames,
+        'fps': frames * NS_PER_SECOND / elapsed if elapsed else 0.0,
+        'bytes_per_frame': (display.total_bytes_sent - bytes_before) / frames,
+        'total': timings.percentiles(),
+        'stages': {pipeline.PIPETIME_NAMES[stage]: timings.percentiles(stage)
+                   for stage in pipeline.PIPETIME_STAGES
+                   if stage != pipeline.PIPETIME_COMPLETE}
+    }
+
+
+def run(frames: int = DEFAULT_FRAMES, screens: list = None) -> dict:
+    """
+    Runs the benchmark
+    :param frames: Frames to render per case
+    :param screens: IDs of the screens to include, None for all
+    :return: Report with one result per screen, orientation and modifier
+    """
+    redis = StandInRedis()
+    app, telemetry = _create_app(redis)
+
+    results = {}
+    for screen_id in screens or app.screen_ids:
+        for orientation_name, orientation in ORIENTATIONS.items():
+            for modifier_name, modifiers in MODIFIERS.items():
+                key = '{}/{}/{}'.format(screen_id, orientation_name, modifier_name)
+                results[key] = _run_case(app, telemetry, redis,
+                                         screen_id, orientation, modifiers, frames)
+                print('{:<45} {:>8.1f} fps {:>7.3f} ms p95'.format(key,
+                                                                   results[key]['fps'],
+                                                                   results[key]['total']['p95']))
+
+    return {
+        'environment': {
+            'python': python_version(),
+            'pillow': pillow_version,
+            'machine': machine()
+        },
+        'frames': frames,
+        'results': results
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> list:
+    """
+    Compares the frame rates of a report against a baseline
+    :param report: Report returned by run()
+    :param baseline: Report of an earlier run
+    :param tolerance: Allowed slowdown in percent
+    :return: List of (case, baseline fps, current fps) of all regressed cases
+    """
+    regressions = []
+    for key, result in report['results'].items():
+        reference = baseline['results'].get(key)
+        if not reference or not reference['fps']:
+            continue
+        if result['fps'] < reference['fps'] * (1 - tolerance / 100):
+            regressions.append((key, reference['fps'], result['fps']))
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(description='Benchmarks the rendering of all screens')
+    parser.add_argument('--frames', type=int, default=DEFAULT_FRAMES,
+                        help='Frames to render per case')
+    parser.add_argument('--screen', action='append', dest='screens',
+                        help='Only benchmark the given screen (may be repeated)')
+    parser.add_argument('--output', help='Write the report as JSON to this file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help='Report to compare against')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='Store this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed slowdown against the baseline in percent')
+    args = parser.parse_args()
+
+    report = run(args.frames, args.screens)
+    if args.output:
+        with open(args.output, 'w') as f:
+            dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            dump(report, f, indent=2)
+        print('Baseline written to {}'.format(args.baseline))
+        return
+
+    if not exists(args.baseline):
+        # Fails, so a check against a missing baseline cannot pass silently
+        print('No baseline found at {}, run with --update-baseline to create one'.format(args.baseline))
+        exit(2)
+
+    with open(args.baseline) as f:
+        baseline = load(f)
+    regressions = compare(report, baseline, args.tolerance)
+    for key, reference, current in regressions:
+        print('REGRESSION {:<45} {:>8.1f} -> {:>8.1f} fps ({:+.1f}%)'.format(
+            key, reference, current, (current / reference - 1) * 100))
+    if regressions:
+        exit(1)
+    print('No regressions against {}'.format(args.baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,9 @@
 from datetime import datetime
 
 from PIL import ImageDraw, Image
-from gfxhat.backlight import set_all as set_all_bg, show as show_bg
 from gfxlib import pipeline
 from gfxlib.objects import GfxApp, Screen, Label, TEXT_ALIGN_CENTER, TEXT_VALIGN_CENTER, TEXT_VALIGN_BOTTOM, Line
+from gfxlib.peripherals import get_peripherals
 from gfxlib.utils import init_fonts, get_new_font
 
 
@@ -79,8 +79,9 @@ APP.add_screens([DevelopScreen(),
                  DisableDevelopModeScreen()])
 PIPELINE = pipeline.RenderPipeline(APP, fps_limit=1)
 
-set_all_bg(255, 0, 0)
-show_bg()
+PERIPHERALS = get_peripherals()
+PERIPHERALS.set_backlight(255, 0, 0)
+PERIPHERALS.flush()
 
 i = 0
 while i < 30:
@@ -90,5 +91,5 @@ while i < 30:
     i += 1
 
 
-set_all_bg(100, 0, 0)
-show_bg()
+PERIPHERALS.set_backlight(100, 0, 0)
+PERIPHERALS.flush()
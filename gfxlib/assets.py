@@ -0,0 +1,202 @@
+from collections import OrderedDict
+from hashlib import sha1
+from io import BytesIO
+from os.path import realpath
+from threading import RLock
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+IMAGE_RMODE_CONVERT_TO_R_MODE = 0b00000
+IMAGE_RMODE_RENDER_NON_ALPHA = 0b00001
+IMAGE_RMODE_DEFAULT = IMAGE_RMODE_CONVERT_TO_R_MODE
+
+# Memory the preprocessed assets may take up before the least recently
+# used ones get evicted
+ASSET_CACHE_SIZE = 512 * 1024
+
+
+class ImageAsset(object):
+    """
+    Preprocessed image resource, shared by every widget using it.
+    The images must be treated as read-only.
+    """
+    __slots__ = ('_image', '_mask')
+
+    def __init__(self, image: Image.Image, mask: Optional[Image.Image]):
+        self._image = image
+        self._mask = mask
+
+    @property
+    def image(self) -> Image.Image:
+        """Bitmap in 'P' mode"""
+        return self._image
+
+    @property
+    def mask(self) -> Optional[Image.Image]:
+        """1-bit mask of the pixels to draw, None to draw all of them"""
+        return self._mask
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self._image.size
+
+    @property
+    def memory_size(self) -> int:
+        width, height = self._image.size
+        size = width * height
+        if self._mask:
+            size += (width + 7) // 8 * height
+        return size
+
+
+def preprocess_image(src: Image.Image, render_mode: int) -> ImageAsset:
+    """
+    Turns a source image into a bitmap and mask ready to be pasted
+    :param src: Source image
+    :param render_mode: IMAGE_RMODE_* flags
+    """
+    if render_mode & IMAGE_RMODE_RENDER_NON_ALPHA:
+        # Drawn through the alpha mask in a single color
+        mask = src.convert('RGBA').getchannel('A').point(lambda a: 255 if a > 128 else 0, '1')
+        return ImageAsset(Image.new('P', src.size, 1), mask)
+    # IMAGE_RMODE_CONVERT_TO_R_MODE: bright pixels are set, transparent
+    # pixels keep the background
+    mask = None
+    if src.mode in ('RGBA', 'LA', 'PA') or 'transparency' in src.info:
+        src = src.convert('RGBA')
+        mask = src.getchannel('A').point(lambda a: 255 if a > 128 else 0, '1')
+    return ImageAsset(src.convert('L').point(lambda v: 1 if v > 128 else 0).convert('P'), mask)
+
+
+class AssetCache(object):
+    """
+    Process-wide registry of preprocessed image resources. Every file is
+    read once per path; files with identical content share one asset.
+    Assets are kept in LRU order and evicted once their total size
+    exceeds the memory cap (widgets keep the assets they already use).
+    """
+
+    def __init__(self, max_size: int = ASSET_CACHE_SIZE):
+        self._max_size = max_size
+        self._size = 0
+        self._assets: 'OrderedDict[Tuple[str, int], ImageAsset]' = OrderedDict()
+        # Path to content digest, so a file only gets read once
+        self._digests: Dict[str, str] = {}
+        self._requested: List[Tuple[str, int]] = []
+        self._lock = RLock()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, value: int):
+        with self._lock:
+            self._max_size = value
+            self._evict()
+
+    @property
+    def size(self) -> int:
+        """Memory taken up by the cached assets in bytes"""
+        return self._size
+
+    @property
+    def hits(self) -> int:
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        return self._misses
+
+    def __len__(self) -> int:
+        return len(self._assets)
+
+    def _get_digest(self, path: str) -> Tuple[str, Optional[bytes]]:
+        digest = self._digests.get(path)
+        if digest:
+            return digest, None
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = sha1(data).hexdigest()
+        self._digests[path] = digest
+        return digest, data
+
+    def get_image(self, path: str, render_mode: int = IMAGE_RMODE_DEFAULT) -> ImageAsset:
+        """
+        Returns the preprocessed image, loading it if it is not cached
+        :param path: Image file
+        :param render_mode: IMAGE_RMODE_* flags
+        """
+        path = realpath(path)
+        with self._lock:
+            digest, data = self._get_digest(path)
+            key = (digest, render_mode)
+            asset = self._assets.get(key)
+            if asset:
+                self._assets.move_to_end(key)
+                self._hits += 1
+                return asset
+
+            self._misses += 1
+            if data is None:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            asset = preprocess_image(Image.open(BytesIO(data)), render_mode)
+            self._assets[key] = asset
+            self._size += asset.memory_size
+            self._evict()
+            return asset
+
+    def request(self, path: str, render_mode: int = IMAGE_RMODE_DEFAULT):
+        """
+        Registers an image to be loaded by the next warm_up()
+        """
+        with self._lock:
+            if (path, render_mode) not in self._requested:
+                self._requested.append((path, render_mode))
+
+    def preload(self, images: List[Tuple[str, int]]):
+        """
+        Loads the given images right away
+        :param images: List of (path, render mode)
+        """
+        for path, render_mode in images:
+            self.get_image(path, render_mode)
+
+    def warm_up(self) -> int:
+        """
+        Loads all images requested so far
+        :return: Number of images processed
+        """
+        with self._lock:
+            requested, self._requested = self._requested, []
+        self.preload(requested)
+        return len(requested)
+
+    def clear(self):
+        with self._lock:
+            self._assets.clear()
+            self._digests.clear()
+            self._size = 0
+
+    def _evict(self):
+        # The most recent asset always stays, even if it exceeds the cap
+        while self._size > self._max_size and len(self._assets) > 1:
+            _, asset = self._assets.popitem(last=False)
+            self._size -= asset.memory_size
+
+
+_ASSETS: AssetCache = None
+
+
+def get_assets() -> AssetCache:
+    """
+    Returns the process-wide asset cache
+    """
+    global _ASSETS
+    if _ASSETS is None:
+        _ASSETS = AssetCache()
+    return _ASSETS
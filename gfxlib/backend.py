@@ -0,0 +1,174 @@
+from os import environ
+from typing import Callable, Dict, List, Tuple
+
+from gfxlib.display import Display, HeadlessDisplay
+
+BACKEND_GFXHAT = 'gfxhat'
+BACKEND_HEADLESS = 'headless'
+
+LED_COUNT = 6
+
+
+class Backend(object):
+    """
+    Hardware the UI runs on: the LCD, the touch buttons with their LEDs
+    and the backlight
+    """
+
+    @property
+    def name(self) -> str:
+        raise NotImplementedError()
+
+    @property
+    def display(self) -> Display:
+        raise NotImplementedError()
+
+    def on_touch(self, button: int, handler: Callable[[int, str], None]):
+        """
+        Registers a handler called with (button, event) on button events
+        """
+        raise NotImplementedError()
+
+    def set_led(self, led: int, state: int):
+        raise NotImplementedError()
+
+    def set_backlight(self, r: int, g: int, b: int):
+        """
+        Sets the color of the whole backlight, taking effect with show_backlight()
+        """
+        raise NotImplementedError()
+
+    def show_backlight(self):
+        raise NotImplementedError()
+
+
+class GfxHatBackend(Backend):
+    """
+    Pimoroni GFX HAT, the gfxhat modules are only imported when the
+    backend is created so the rest of the UI can be loaded without them
+    """
+
+    def __init__(self):
+        from gfxhat import lcd, touch, backlight
+        self._touch = touch
+        self._backlight = backlight
+        self._display = Display(lcd.st7567)
+
+    @property
+    def name(self) -> str:
+        return BACKEND_GFXHAT
+
+    @property
+    def display(self) -> Display:
+        return self._display
+
+    def on_touch(self, button: int, handler: Callable[[int, str], None]):
+        self._touch.on(button, handler)
+
+    def set_led(self, led: int, state: int):
+        self._touch.set_led(led, state)
+
+    def set_backlight(self, r: int, g: int, b: int):
+        self._backlight.set_all(r, g, b)
+
+    def show_backlight(self):
+        self._backlight.show()
+
+
+class HeadlessBackend(Backend):
+    """
+    Backend without any hardware. The frame is kept in memory, button
+    events can be injected and all writes to the LEDs and the backlight
+    are recorded, so the UI can run on any machine.
+    """
+
+    def __init__(self):
+        self._display = HeadlessDisplay()
+        self._handlers: Dict[int, List[Callable[[int, str], None]]] = {}
+        self._leds = [0] * LED_COUNT
+        self._led_writes = 0
+        self._backlight = (0, 0, 0)
+        self._pending_backlight = (0, 0, 0)
+        self._backlight_writes = 0
+
+    @property
+    def name(self) -> str:
+        return BACKEND_HEADLESS
+
+    @property
+    def display(self) -> HeadlessDisplay:
+        return self._display
+
+    @property
+    def leds(self) -> Tuple[int, ...]:
+        return tuple(self._leds)
+
+    @property
+    def led_writes(self) -> int:
+        return self._led_writes
+
+    @property
+    def backlight(self) -> Tuple[int, int, int]:
+        """Backlight color as of the last call to show_backlight()"""
+        return self._backlight
+
+    @property
+    def backlight_writes(self) -> int:
+        return self._backlight_writes
+
+    def on_touch(self, button: int, handler: Callable[[int, str], None]):
+        self._handlers.setdefault(button, []).append(handler)
+
+    def inject(self, button: int, event: str):
+        """
+        Simulates a button event
+        :param button: Button (see gfxlib.input.BTN_*)
+        :param event: Event (see gfxlib.input.EVT_*)
+        """
+        for handler in self._handlers.get(button, []):
+            handler(button, event)
+
+    def set_led(self, led: int, state: int):
+        self._leds[led] = 1 if state else 0
+        self._led_writes += 1
+
+    def set_backlight(self, r: int, g: int, b: int):
+        self._pending_backlight = (r, g, b)
+
+    def show_backlight(self):
+        self._backlight = self._pending_backlight
+        self._backlight_writes += 1
+
+
+BACKENDS = {
+    BACKEND_GFXHAT: GfxHatBackend,
+    BACKEND_HEADLESS: HeadlessBackend
+}
+
+_BACKEND: Backend = None
+
+
+def get_backend() -> Backend:
+    """
+    Returns the process-wide backend, creating the one selected by
+    CARPI_UI_BACKEND (default: gfxhat) on first use
+    """
+    global _BACKEND
+    if _BACKEND is None:
+        set_backend(environ.get('CARPI_UI_BACKEND', BACKEND_GFXHAT))
+    return _BACKEND
+
+
+def set_backend(backend) -> Backend:
+    """
+    Replaces the process-wide backend. Has to be called before any
+    screen or pipeline is created.
+    :param backend: Backend instance or name (see BACKEND_*)
+    """
+    global _BACKEND
+    if isinstance(backend, str):
+        if backend not in BACKENDS:
+            raise ValueError('Unknown backend "{}", expected one of {}'.format(backend, ', '.join(BACKENDS)))
+        backend = BACKENDS[backend]()
+    _BACKEND = backend
+    return backend
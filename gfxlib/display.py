@@ -0,0 +1,239 @@
+from typing import List, Optional, Tuple
+
+from PIL import Image
+
+# ST7567 commands (as defined by gfxhat.st7567, which can only be
+# imported on a Raspberry Pi)
+ST7567_SETPAGESTART = 0xb0
+ST7567_PAGESTART_MASK = 0x07
+ST7567_SETCOLL = 0x00
+ST7567_COLL_MASK = 0x0f
+ST7567_SETCOLH = 0x10
+ST7567_COLH_MASK = 0x0f
+ST7567_ENTER_RMWMODE = 0xe0
+ST7567_EXIT_RMWMODE = 0xee
+
+LCD_WIDTH = 128
+LCD_HEIGHT = 64
+LCD_SIZE = (LCD_WIDTH, LCD_HEIGHT)
+
+LCD_PAGE_HEIGHT = 8
+LCD_PAGES = LCD_HEIGHT // LCD_PAGE_HEIGHT
+
+# PIL packs 1-bit images MSB first, the ST7567 expects the top-most
+# pixel of a page in the LSB
+BIT_REVERSE = bytes(int('{:08b}'.format(i)[::-1], 2) for i in range(256))
+
+
+def get_changed_span(old: bytes, new: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Returns the range of bytes that differ between two byte strings
+    of the same length
+    :param old: Old content
+    :param new: New content
+    :return: (start, end (exclusive)) or None if both are equal
+    """
+    if old == new:
+        return None
+    # XOR both strings as big integers, the highest and lowest set bit
+    # mark the first and last differing byte
+    delta = int.from_bytes(old, 'big') ^ int.from_bytes(new, 'big')
+    length = len(new)
+    start = length - 1 - ((delta.bit_length() - 1) // 8)
+    end = length - (((delta & -delta).bit_length() - 1) // 8)
+    return start, end
+
+
+class Display(object):
+    """
+    Output backend for the ST7567 display controller of the GFX HAT.
+    Keeps a copy of the display RAM and only transfers the columns of
+    each page that have changed since the last call to show().
+    """
+
+    def __init__(self, controller):
+        """
+        :param controller: ST7567 driver, e.g. gfxhat.lcd.st7567
+        """
+        self._controller = controller
+        self._buffer = bytearray(LCD_WIDTH * LCD_PAGES)
+        self._dirty: List[Optional[Tuple[int, int]]] = []
+        self._bytes_sent = 0
+        self._total_bytes_sent = 0
+        self._show_count = 0
+        self.invalidate()
+
+    @property
+    def dimensions(self) -> Tuple[int, int]:
+        return LCD_SIZE
+
+    @property
+    def buffer(self) -> bytes:
+        return bytes(self._buffer)
+
+    @property
+    def bytes_sent(self) -> int:
+        """Number of bytes sent to the controller by the last call to show()"""
+        return self._bytes_sent
+
+    @property
+    def total_bytes_sent(self) -> int:
+        return self._total_bytes_sent
+
+    @property
+    def show_count(self) -> int:
+        return self._show_count
+
+    @property
+    def is_dirty(self) -> bool:
+        return any(self._dirty)
+
+    def invalidate(self):
+        """Marks the whole display as dirty, e.g. if its RAM content is unknown"""
+        self._dirty = [(0, LCD_WIDTH)] * LCD_PAGES
+
+    def write(self, page: int, x_start: int, data: bytes, compare: bool = True):
+        """
+        Writes data into a single page of the display buffer
+        :param page: Page to write to (0 = top)
+        :param x_start: Column of the first byte
+        :param data: Page bytes, one per column
+        :param compare: False if the caller knows the whole span differs,
+                        skipping the comparison with the buffer
+        """
+        offset = page * LCD_WIDTH + x_start
+        if compare:
+            span = get_changed_span(self._buffer[offset:offset + len(data)], data)
+        else:
+            span = (0, len(data)) if data else None
+        if span:
+            self._buffer[offset:offset + len(data)] = data
+            self._mark_dirty(page, x_start + span[0], x_start + span[1])
+
+    def write_frame(self, data: bytes):
+        """
+        Replaces the whole display buffer
+        :param data: Display buffer contents in page format
+        """
+        for page in range(LCD_PAGES):
+            offset = page * LCD_WIDTH
+            self.write(page, 0, data[offset:offset + LCD_WIDTH])
+
+    def clear(self):
+        self.write_frame(bytes(len(self._buffer)))
+
+    def _mark_dirty(self, page: int, x_start: int, x_end: int):
+        dirty = self._dirty[page]
+        if dirty:
+            x_start, x_end = min(dirty[0], x_start), max(dirty[1], x_end)
+        self._dirty[page] = (x_start, x_end)
+
+    def start_frame(self):
+        """
+        Resets the per-frame statistics, so a frame that is skipped
+        without calling show() reports no bytes sent
+        """
+        self._bytes_sent = 0
+
+    def show(self) -> int:
+        """
+        Sends all dirty page spans to the display controller
+        :return: Number of bytes sent
+        """
+        self._bytes_sent = 0
+        sent = 0
+        if self.is_dirty:
+            sent = self._transfer()
+            self._dirty = [None] * LCD_PAGES
+
+        self._bytes_sent = sent
+        self._total_bytes_sent += sent
+        self._show_count += 1
+        return sent
+
+    def _transfer(self) -> int:
+        controller = self._controller
+        controller.setup()
+
+        controller._command([ST7567_ENTER_RMWMODE])
+        sent = 1
+        for page, span in enumerate(self._dirty):
+            if not span:
+                continue
+            x_start, x_end = span
+            offset = page * LCD_WIDTH
+            controller._command([ST7567_SETPAGESTART | page,
+                                 ST7567_SETCOLL | (x_start & ST7567_COLL_MASK),
+                                 ST7567_SETCOLH | (x_start >> 4)])
+            controller._data(list(self._buffer[offset + x_start:offset + x_end]))
+            sent += 3 + x_end - x_start
+        controller._command([ST7567_EXIT_RMWMODE])
+        return sent + 1
+
+
+class HeadlessController(object):
+    """
+    In-memory stand-in for the ST7567 driver. Interprets the page and
+    column addressing commands sent by Display and keeps the resulting
+    display RAM, counting every byte that would have gone over SPI.
+    """
+
+    def __init__(self):
+        self._ram = bytearray(LCD_WIDTH * LCD_PAGES)
+        self._page = 0
+        self._column = 0
+        self._bytes_received = 0
+
+    @property
+    def ram(self) -> bytes:
+        return bytes(self._ram)
+
+    @property
+    def bytes_received(self) -> int:
+        return self._bytes_received
+
+    def setup(self):
+        pass
+
+    def _command(self, data: List[int]):
+        self._bytes_received += len(data)
+        for command in data:
+            if command & 0xf0 == ST7567_SETPAGESTART:
+                self._page = command & ST7567_PAGESTART_MASK
+            elif command & 0xf0 == ST7567_SETCOLH:
+                self._column = (self._column & ST7567_COLL_MASK) | ((command & ST7567_COLH_MASK) << 4)
+            elif command & 0xf0 == ST7567_SETCOLL:
+                self._column = (self._column & ~ST7567_COLL_MASK) | (command & ST7567_COLL_MASK)
+
+    def _data(self, data: List[int]):
+        self._bytes_received += len(data)
+        offset = self._page * LCD_WIDTH + self._column
+        self._ram[offset:offset + len(data)] = bytes(data)
+        self._column += len(data)
+
+
+class HeadlessDisplay(Display):
+    """
+    Display without hardware, keeping the transferred frame in memory
+    """
+
+    def __init__(self):
+        super().__init__(HeadlessController())
+
+    @property
+    def controller(self) -> HeadlessController:
+        return self._controller
+
+    def to_image(self) -> Image.Image:
+        """
+        Converts the display RAM back into an image
+        :return: 1-bit image of the display content
+        """
+        ram = self._controller.ram
+        image = Image.new('1', LCD_SIZE)
+        for page in range(LCD_PAGES):
+            # Each byte is one column of the page with the top pixel in bit 0
+            columns = ram[page * LCD_WIDTH:(page + 1) * LCD_WIDTH].translate(BIT_REVERSE)
+            region = Image.frombytes('1', (LCD_PAGE_HEIGHT, LCD_WIDTH), columns)
+            image.paste(region.transpose(Image.TRANSPOSE), (0, page * LCD_PAGE_HEIGHT))
+        return image
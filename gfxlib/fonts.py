@@ -0,0 +1,153 @@
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from PIL import Image
+
+# Characters loaded into the atlas by default (ASCII and Latin-1)
+DEFAULT_CHARSET = range(0, 256)
+
+# Rendered strings kept per font, least recently used ones get dropped
+MASK_CACHE_SIZE = 128
+
+
+class BitmapFont(object):
+    """
+    Renders text from a fixed-width BDF font. All glyphs are loaded once
+    into a packed 1-bit atlas with one cell per character, so rendering
+    a string only copies glyph cells and measuring it is plain arithmetic.
+    The masks of recently drawn strings are kept, drawing them again
+    does not render anything.
+    Implements the font interface used by ImageDraw, so it can be used
+    instead of a FreeTypeFont (e.g. for a Label).
+    """
+
+    def __init__(self, file: str, charset=DEFAULT_CHARSET, mask_cache_size: int = MASK_CACHE_SIZE):
+        self._file = file
+        self._cell_size: Tuple[int, int] = (0, 0)
+        self._ascent = 0
+        self._default_char = 0
+        self._atlas: Image.Image = None
+        self._glyph_index: Dict[str, int] = {}
+        self._cells: Dict[str, bytes] = {}
+        self._masks = OrderedDict()
+        self._mask_cache_size = mask_cache_size
+        self._load(file, set(charset))
+
+    @property
+    def cell_size(self) -> Tuple[int, int]:
+        return self._cell_size
+
+    @property
+    def atlas(self) -> Image.Image:
+        return self._atlas
+
+    def _load(self, file: str, charset: set):
+        glyphs = []
+        with open(file) as f:
+            lines = iter(f.read().splitlines())
+
+        for line in lines:
+            key, _, value = line.partition(' ')
+            if key == 'FONTBOUNDINGBOX':
+                width, height = [int(v) for v in value.split()[:2]]
+                self._cell_size = (width, height)
+            elif key == 'FONT_ASCENT':
+                self._ascent = int(value)
+            elif key == 'DEFAULT_CHAR':
+                self._default_char = int(value)
+            elif key == 'STARTCHAR':
+                glyph = self._read_glyph(lines)
+                if glyph[0] in charset or glyph[0] == self._default_char:
+                    glyphs.append(glyph)
+
+        cell_width, cell_height = self._cell_size
+        self._atlas = Image.new('1', (cell_width * len(glyphs), cell_height))
+        for i, (encoding, bbx, bitmap) in enumerate(glyphs):
+            width, height, x_off, y_off = bbx
+            if width and height:
+                # Glyphs reaching outside of the cell get clipped
+                cell = Image.new('1', self._cell_size)
+                cell.paste(Image.frombytes('1', (width, height), bitmap),
+                           (x_off, self._ascent - y_off - height))
+                self._atlas.paste(cell, (i * cell_width, 0))
+            self._glyph_index[chr(encoding)] = i
+
+    @staticmethod
+    def _read_glyph(lines) -> Tuple[int, Tuple[int, int, int, int], bytes]:
+        encoding = -1
+        bbx = (0, 0, 0, 0)
+        rows = []
+        for line in lines:
+            key, _, value = line.partition(' ')
+            if key == 'ENCODING':
+                encoding = int(value.split()[0])
+            elif key == 'BBX':
+                bbx = tuple(int(v) for v in value.split())
+            elif key == 'BITMAP':
+                for row in lines:
+                    if row == 'ENDCHAR':
+                        return encoding, bbx, bytes.fromhex(''.join(rows))
+                    rows.append(row)
+        return encoding, bbx, b''
+
+    def _get_cell(self, char: str) -> bytes:
+        """
+        Returns the cell of a character transposed and packed, one row
+        per column of the glyph. Rows are padded to full bytes, so the
+        cells of a string can simply be concatenated.
+        """
+        cell = self._cells.get(char)
+        if cell is None:
+            index = self._glyph_index.get(char)
+            if index is None:
+                index = self._glyph_index.get(chr(self._default_char), 0)
+            width, height = self._cell_size
+            cell = self._atlas.crop((index * width, 0, (index + 1) * width, height)) \
+                .transpose(Image.TRANSPOSE).tobytes()
+            self._cells[char] = cell
+        return cell
+
+    def getsize(self, text: str, *args, **kwargs) -> Tuple[int, int]:
+        return len(text) * self._cell_size[0], self._cell_size[1]
+
+    def getbbox(self, text: str, *args, **kwargs) -> Tuple[int, int, int, int]:
+        width, height = self.getsize(text)
+        return 0, 0, width, height
+
+    def getlength(self, text: str, *args, **kwargs) -> float:
+        return float(len(text) * self._cell_size[0])
+
+    def getmetrics(self) -> Tuple[int, int]:
+        return self._ascent, self._cell_size[1] - self._ascent
+
+    def getmask(self, text: str, mode: str = '', *args, **kwargs):
+        """
+        Renders a single line of text for ImageDraw
+        :param text: Text to render
+        :param mode: Ignored, the mask is always 1-bit
+        :return: Core image of the rendered text, as used by ImageDraw
+        """
+        mask = self._masks.get(text)
+        if mask is None:
+            mask = self.render(text).im
+            self._masks[text] = mask
+            if len(self._masks) > self._mask_cache_size:
+                self._masks.popitem(last=False)
+        else:
+            self._masks.move_to_end(text)
+        return mask
+
+    def render(self, text: str) -> Image.Image:
+        """
+        Renders a single line of text
+        :param text: Text to render
+        :return: 1-bit image of the rendered text
+        """
+        width, height = self.getsize(text)
+        if not width:
+            return Image.new('1', (width, height))
+        columns = b''.join([self._get_cell(char) for char in text])
+        return Image.frombytes('1', (height, width), columns).transpose(Image.TRANSPOSE)
+
+    def __str__(self) -> str:
+        return '{} {}'.format(type(self).__name__, self._file)
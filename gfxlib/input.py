@@ -1,4 +1,8 @@
-from gfxhat import touch
+from collections import deque
+from time import perf_counter_ns
+from typing import Callable, Dict, List, Optional
+
+from gfxlib.backend import get_backend
 
 BTN_UP = 0
 BTN_DOWN = 1
@@ -16,9 +20,105 @@ BUTTONS = [
     BTN_PLUS
 ]
 
+BUTTON_NAMES = {
+    BTN_UP: 'up',
+    BTN_DOWN: 'down',
+    BTN_BACK: 'back',
+    BTN_MINUS: 'minus',
+    BTN_ENTER: 'enter',
+    BTN_PLUS: 'plus'
+}
+
 EVT_PRESS = 'press'
 EVT_RELEASE = 'release'
 
+# Events of a button following its previous event faster than this
+# are treated as contact bounce and dropped
+DEBOUNCE_TIME_NS = 50000000
+
 
 def on_touch(button: int, handler):
-    touch.on(button, handler)
+    get_backend().on_touch(button, handler)
+
+
+class InputEvent(object):
+    __slots__ = ('button', 'event', 'timestamp')
+
+    def __init__(self, button: int, event: str, timestamp: int):
+        """
+        :param button: Button (BTN_*)
+        :param event: Event (EVT_*)
+        :param timestamp: perf_counter_ns() when the event was received
+        """
+        self.button = button
+        self.event = event
+        self.timestamp = timestamp
+
+    def __str__(self) -> str:
+        return 'InputEvent {} {} @ {}'.format(self.button, self.event, self.timestamp)
+
+
+class InputQueue(object):
+    """
+    Collects button events from the touch thread until the render loop
+    drains them. Relies on deque.append and deque.popleft being atomic,
+    so neither side ever has to take a lock.
+    """
+
+    def __init__(self, debounce_time_ns: int = DEBOUNCE_TIME_NS):
+        self._events = deque()
+        self._debounce_time_ns = debounce_time_ns
+        # Last accepted event per button, only touched by the producer
+        self._last_events: Dict[int, InputEvent] = {}
+        self._listeners: List[Callable[[], None]] = []
+
+    def add_listener(self, listener: Callable[[], None]):
+        """
+        Registers a callback invoked (on the producing thread) whenever
+        an event has been queued, e.g. to wake up the render loop
+        """
+        # Replaced instead of modified, push() may be iterating it
+        self._listeners = self._listeners + [listener]
+
+    def remove_listener(self, listener: Callable[[], None]):
+        self._listeners = [registered for registered in self._listeners if registered != listener]
+
+    def push(self, button: int, event: str, timestamp: int = None) -> bool:
+        """
+        Queues an event unless it is considered a bounce
+        :return: True if the event has been queued
+        """
+        timestamp = perf_counter_ns() if timestamp is None else timestamp
+        last = self._last_events.get(button)
+        # A release always gets through after an accepted press (or
+        # held event), so presses and releases stay balanced
+        if last and timestamp - last.timestamp < self._debounce_time_ns \
+                and not (last.event != EVT_RELEASE and event == EVT_RELEASE):
+            return False
+
+        input_event = InputEvent(button, event, timestamp)
+        self._last_events[button] = input_event
+        self._events.append(input_event)
+        for listener in self._listeners:
+            listener()
+        return True
+
+    def pop(self) -> Optional[InputEvent]:
+        try:
+            return self._events.popleft()
+        except IndexError:
+            return None
+
+    def drain(self) -> List[InputEvent]:
+        """
+        Removes and returns all queued events, oldest first
+        """
+        events = []
+        event = self.pop()
+        while event:
+            events.append(event)
+            event = self.pop()
+        return events
+
+    def __len__(self) -> int:
+        return len(self._events)
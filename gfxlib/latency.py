@@ -0,0 +1,136 @@
+from typing import Dict, List, Optional, Tuple
+
+from gfxlib.input import BUTTON_NAMES
+
+# Upper bounds of the histogram buckets in ms, the last bucket is open
+LATENCY_BUCKETS_MS = [5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500, 1000]
+
+
+class InputTag(object):
+    """
+    Input event handled by the app, waiting for the frame showing its result
+    """
+    __slots__ = ('button', 'event', 'timestamp', 'screen_id')
+
+    def __init__(self, button: int, event: str, timestamp: int, screen_id: str):
+        """
+        :param button: Button (BTN_*)
+        :param event: Event (EVT_*)
+        :param timestamp: perf_counter_ns() when the event was received
+        :param screen_id: Screen the event has been handled by
+        """
+        self.button = button
+        self.event = event
+        self.timestamp = timestamp
+        self.screen_id = screen_id
+
+
+class LatencyHistogram(object):
+    """
+    Counts latencies in fixed buckets (see LATENCY_BUCKETS_MS)
+    """
+
+    def __init__(self):
+        self._counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def mean(self) -> float:
+        return self._sum / self._count if self._count else 0.0
+
+    @property
+    def max(self) -> float:
+        return self._max
+
+    @property
+    def buckets(self) -> List[Tuple[Optional[int], int]]:
+        """
+        :return: List of (upper bound in ms or None for the open bucket, count)
+        """
+        return list(zip(LATENCY_BUCKETS_MS + [None], self._counts))
+
+    def add(self, latency_ms: float):
+        i = 0
+        while i < len(LATENCY_BUCKETS_MS) and latency_ms > LATENCY_BUCKETS_MS[i]:
+            i += 1
+        self._counts[i] += 1
+        self._count += 1
+        self._sum += latency_ms
+        self._max = max(self._max, latency_ms)
+
+    def percentile(self, pct: float) -> Optional[int]:
+        """
+        :return: Upper bound of the bucket holding the given percentile,
+                 None if it lies within the open bucket
+        """
+        target = self._count * pct
+        seen = 0
+        for bound, count in self.buckets:
+            seen += count
+            if count and seen >= target:
+                return bound
+        return None
+
+    def __str__(self) -> str:
+        p95 = self.percentile(0.95)
+        return '{:>4} event(s), mean {:6.1f} ms, max {:6.1f} ms, p95 <= {}'.format(
+            self._count, self.mean, self._max, '{} ms'.format(p95) if p95 is not None else 'inf')
+
+
+class InputLatencyStats(object):
+    """
+    Input-to-photon latency: time from receiving an input event until the
+    first frame reflecting it has been sent to the display
+    """
+
+    def __init__(self):
+        self._by_button: Dict[int, LatencyHistogram] = {}
+        self._by_screen: Dict[str, LatencyHistogram] = {}
+        self._total = LatencyHistogram()
+        self._unchanged = 0
+
+    @property
+    def total(self) -> LatencyHistogram:
+        return self._total
+
+    @property
+    def by_button(self) -> Dict[int, LatencyHistogram]:
+        return self._by_button
+
+    @property
+    def by_screen(self) -> Dict[str, LatencyHistogram]:
+        return self._by_screen
+
+    @property
+    def unchanged(self) -> int:
+        """Number of events that did not change the frame"""
+        return self._unchanged
+
+    def record(self, tags: List[InputTag], shown: int):
+        """
+        Records events whose result has been shown
+        :param tags: Events reflected by the frame
+        :param shown: perf_counter_ns() after the frame has been sent
+        """
+        for tag in tags:
+            latency_ms = (shown - tag.timestamp) / 1000000
+            self._total.add(latency_ms)
+            self._by_button.setdefault(tag.button, LatencyHistogram()).add(latency_ms)
+            self._by_screen.setdefault(tag.screen_id, LatencyHistogram()).add(latency_ms)
+
+    def record_unchanged(self, tags: List[InputTag]):
+        self._unchanged += len(tags)
+
+    def report(self) -> str:
+        lines = ['Input latency: {} ({} without visible change)'.format(self._total, self._unchanged)]
+        for button, histogram in sorted(self._by_button.items()):
+            lines.append('  button {:<8} {}'.format(BUTTON_NAMES.get(button, button), histogram))
+        for screen_id, histogram in sorted(self._by_screen.items()):
+            lines.append('  screen {:<16} {}'.format(screen_id, histogram))
+        return '\n'.join(lines)
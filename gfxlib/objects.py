@@ -1,11 +1,17 @@
-from typing import Dict, List, Tuple
+from collections import OrderedDict
+from threading import Lock, Thread
+from typing import Callable, Dict, List, Optional, Tuple
 from PIL import ImageDraw, Image
 from PIL.ImageFont import FreeTypeFont
 from datetime import datetime
 from math import ceil
+from time import perf_counter_ns
 
+from gfxlib.assets import get_assets, ImageAsset, IMAGE_RMODE_CONVERT_TO_R_MODE, IMAGE_RMODE_RENDER_NON_ALPHA, \
+    IMAGE_RMODE_DEFAULT
 from gfxlib.exceptions import ScreenStillActiveException
 from gfxlib import input
+from gfxlib.latency import InputTag
 
 TEXT_ALIGN_LEFT = 0
 TEXT_ALIGN_CENTER = -0.5
@@ -15,11 +21,15 @@ TEXT_VALIGN_TOP = 0
 TEXT_VALIGN_CENTER = -0.5
 TEXT_VALIGN_BOTTOM = -1
 
+LABEL_CACHE_SIZE = 256
+
 
 class RenderObject(object):
     def __init__(self, xy: tuple):
         self._position = xy
         self._is_visible = True
+        self._is_dirty = True
+        self._parent: RenderObject = None
 
     @property
     def is_visible(self):
@@ -27,7 +37,9 @@ class RenderObject(object):
 
     @is_visible.setter
     def is_visible(self, value):
-        self._is_visible = value
+        if value != self._is_visible:
+            self._is_visible = value
+            self.invalidate()
 
     @property
     def position(self) -> Tuple[int, int]:
@@ -35,11 +47,27 @@ class RenderObject(object):
 
     @position.setter
     def position(self, value: Tuple[int, int]):
-        self._position = value
+        if value != self._position:
+            self._position = value
+            self.invalidate()
+
+    @property
+    def is_dirty(self) -> bool:
+        return self._is_dirty
+
+    def invalidate(self):
+        """
+        Marks this object and all of its parents as changed,
+        so they get drawn again with the next frame
+        """
+        self._is_dirty = True
+        if self._parent:
+            self._parent.invalidate()
 
     def render(self, draw: ImageDraw.ImageDraw, image: Image.Image):
         if self._is_visible:
             self._render(draw, image)
+        self._is_dirty = False
 
     def _render(self, draw: ImageDraw.ImageDraw, image: Image.Image):
         raise NotImplementedError()
@@ -65,6 +93,8 @@ class RenderObjectArray(RenderObject):
 
     def add_object(self, obj: RenderObject) -> RenderObject:
         self._children.append(obj)
+        obj._parent = self
+        self.invalidate()
         return obj
 
     def _render(self, draw: ImageDraw.ImageDraw, image: Image.Image):
@@ -80,11 +110,21 @@ class Screen(RenderObjectArray):
     def __init__(self, screen_id: str, *args: RenderObject):
         super(Screen, self).__init__(*args)
         self._id = screen_id
+        self._target_fps: float = None
 
     @property
     def screen_id(self):
         return self._id
 
+    @property
+    def target_fps(self) -> float:
+        """Frame rate requested by this screen, None to use the pipeline default"""
+        return self._target_fps
+
+    @target_fps.setter
+    def target_fps(self, value: float):
+        self._target_fps = value
+
     def __str__(self) -> str:
         return "Screen \"{}\" ({} object(s))".format(self.screen_id, len(self._children))
 
@@ -232,6 +272,39 @@ class Rectangle(RenderObject):
                        outline=self._bordered)
 
 
+class RasterCache(object):
+    """
+    Least recently used cache for pre-rendered bitmaps,
+    holding up to max_size entries
+    """
+
+    def __init__(self, max_size: int):
+        self._entries = OrderedDict()
+        self._max_size = max_size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+# Text bitmaps shared by all labels
+LABEL_CACHE = RasterCache(LABEL_CACHE_SIZE)
+
+
 class Label(RenderObject):
     def __init__(self,
                  xy: tuple, font: FreeTypeFont, text: str,
@@ -250,21 +323,39 @@ class Label(RenderObject):
 
     @filled.setter
     def filled(self, value: int):
-        self._fill = value
+        if value != self._fill:
+            self._fill = value
+            self.invalidate()
 
     def _render(self, draw: ImageDraw.ImageDraw, image: Image.Image):
-        pos = self._position
-
-        if self._align != TEXT_ALIGN_LEFT or self._valign != TEXT_VALIGN_TOP:
-            render_size = draw.textsize(text=self._text,
-                                        font=self._font)
-            pos_x = self._position[0] + (self._align * render_size[0])
-            pos_y = self._position[1] + (self._valign * render_size[1])
-
-            pos = (ceil(pos_x), ceil(pos_y))
-
-        draw.text(xy=pos, text=self._text,
-                  fill=self._fill, font=self._font)
+        key = (self._font, self._text, self._align, self._valign)
+        raster = LABEL_CACHE.get(key)
+        if raster is None:
+            raster = self._rasterize(draw)
+            LABEL_CACHE.put(key, raster)
+
+        bitmap, offset = raster
+        if bitmap:
+            draw.bitmap((self._position[0] + offset[0], self._position[1] + offset[1]),
+                        bitmap, fill=self._fill)
+
+    def _rasterize(self, draw: ImageDraw.ImageDraw) -> Tuple[Image.Image, Tuple[int, int]]:
+        """
+        Renders the text into a 1-bit mask. The fill is applied when
+        the mask is drawn, so it is not part of the raster.
+        :return: Mask (None for empty text) and its offset to the label position
+        """
+        render_size = draw.textbbox((0, 0), text=self._text,
+                                    font=self._font)[2:]
+        offset = (ceil(self._align * render_size[0]),
+                  ceil(self._valign * render_size[1]))
+        if not render_size[0] or not render_size[1]:
+            return None, offset
+
+        bitmap = Image.new('1', render_size)
+        ImageDraw.Draw(bitmap).text(xy=(0, 0), text=self._text,
+                                    fill=1, font=self._font)
+        return bitmap, offset
 
     @property
     def text(self):
@@ -272,7 +363,9 @@ class Label(RenderObject):
 
     @text.setter
     def text(self, value: str):
-        self._text = value
+        if value != self._text:
+            self._text = value
+            self.invalidate()
 
     def __str__(self) -> str:
         return '{}: {}'.format(super().__str__(),
@@ -290,7 +383,7 @@ class DateTimeLabel(Label):
         self._format = format
 
     def update(self, now: datetime, app):
-        self._text = now.strftime(self._format)
+        self.text = now.strftime(self._format)
 
 
 class SpinnerLabel(Label):
@@ -324,7 +417,10 @@ class BarGraph(RenderObject):
 
     @p_value.setter
     def p_value(self, value):
-        self._value = max(min(value, self._max_value), self._min_value)
+        value = max(min(value, self._max_value), self._min_value)
+        if value != self._value:
+            self._value = value
+            self.invalidate()
 
     def _render(self, draw: ImageDraw.ImageDraw, image: Image.Image):
         rect = (self._position[0], self._position[1],
@@ -338,8 +434,10 @@ class BarGraph(RenderObject):
         zero_pt = (self._position[0] + 2 + (zero_pct * (self._width - 4)),
                    self._position[1] + 2)
         val_pct = self._value / (self._max_value - self._min_value)
-        fill_rect = (zero_pt[0], zero_pt[1],
-                     zero_pt[0] + (val_pct * (self._width - 4)), zero_pt[1] + self._height - 4)
+        val_x = zero_pt[0] + (val_pct * (self._width - 4))
+        # Negative values grow to the left of the zero point
+        fill_rect = (min(zero_pt[0], val_x), zero_pt[1],
+                     max(zero_pt[0], val_x), zero_pt[1] + self._height - 4)
         draw.rectangle(fill_rect, fill=1)
 
         # Draw Zero Indicator
@@ -362,23 +460,31 @@ class BarGraph(RenderObject):
                           fill=255, width=1)
 
 
-IMAGE_RMODE_CONVERT_TO_R_MODE = 0b00000
-IMAGE_RMODE_RENDER_NON_ALPHA = 0b00001
-IMAGE_RMODE_DEFAULT = IMAGE_RMODE_CONVERT_TO_R_MODE
-
-
 class BaseImage(RenderObject):
+    """
+    Image widget. The bitmap (and the mask, if the image has transparent
+    parts) are built once and pasted as they are on every render.
+    """
+
     def __init__(self, xy: tuple, wh: tuple):
         super().__init__(xy)
         self._preprocessed_image: Image.Image = Image.new('P', wh) if wh else None
+        self._mask: Image.Image = None
 
     def _preprocess_image(self) -> Image.Image:
         raise NotImplementedError()
 
+    def _preprocess_mask(self) -> Image.Image:
+        """
+        :return: 1-bit mask of the pixels to draw, None to draw all of them
+        """
+        return None
+
     def _render(self, draw: ImageDraw.ImageDraw, image: Image.Image):
         if not self._preprocessed_image:
             self._preprocessed_image = self._preprocess_image()
-        image.paste(self._preprocessed_image.copy(), self._position)
+            self._mask = self._preprocess_mask()
+        image.paste(self._preprocessed_image, self._position, self._mask)
 
 
 class ArrayImage(BaseImage):
@@ -389,14 +495,7 @@ class ArrayImage(BaseImage):
     def _preprocess_image(self) -> Image.Image:
         data = self._image_data
         img = Image.new('P', (len(data[0]), len(data)))
-        draw = ImageDraw.Draw(img)
-
-        for x in range(img.size[0]):
-            for y in range(img.size[1]):
-                p = data[y][x]
-                if p:
-                    draw.point((x, y), p)
-
+        img.putdata([p for row in data for p in row])
         return img
 
 
@@ -407,26 +506,21 @@ class FileImage(BaseImage):
                  render_mode: int = IMAGE_RMODE_DEFAULT):
         super().__init__(xy, None)
         self._render_mode = render_mode
-        self._source_image: Image.Image = Image.open(file)
         self._source_image_path = file
+        self._asset: ImageAsset = None
+        # Loaded through the shared asset cache, by its warm-up or on first render
+        get_assets().request(file, render_mode)
 
-    def _preprocess_image(self) -> Image.Image:
-        src = self._source_image
-        rmode = self._render_mode
-
-        img = Image.new('P', src.size)
-        draw = ImageDraw.Draw(img)
+    def _get_asset(self) -> ImageAsset:
+        if not self._asset:
+            self._asset = get_assets().get_image(self._source_image_path, self._render_mode)
+        return self._asset
 
-        if rmode & IMAGE_RMODE_RENDER_NON_ALPHA:
-            for x in range(src.size[0]):
-                for y in range(src.size[1]):
-                    p = src.getpixel((x, y))
-                    if p[3] > 128:
-                        draw.point((x, y), fill=True)
-        elif rmode & IMAGE_RMODE_CONVERT_TO_R_MODE:
-            img.paste(src.convert('R').copy())
+    def _preprocess_image(self) -> Image.Image:
+        return self._get_asset().image
 
-        return img
+    def _preprocess_mask(self) -> Image.Image:
+        return self._get_asset().mask
 
     def __str__(self) -> str:
         return '{} {}'.format(super().__str__(), self._source_image_path)
@@ -437,19 +531,37 @@ class GfxApp(object):
                  screens: List[Screen] = None,
                  active_screen: str = None):
         self._screens: Dict[str, Screen] = {}
+        self._factories: Dict[str, Callable[[], Screen]] = {}
+        self._build_lock = Lock()
         self._active_screen: str = active_screen
         self._alive = True
+        self._is_dirty = True
+        self._input_queue = input.InputQueue()
+        self._input_tags: List[InputTag] = []
 
         if screens:
             self.add_screens(screens)
 
+        # Events arrive on the touch thread, they are handled by the
+        # render loop through process_input()
         for button in input.BUTTONS:
-            input.on_touch(button, self.handle_input)
+            input.on_touch(button, self._input_queue.push)
 
     @property
     def alive(self):
         return self._alive
 
+    @property
+    def input_queue(self) -> input.InputQueue:
+        return self._input_queue
+
+    @property
+    def screen_ids(self) -> List[str]:
+        """IDs of all screens, including those not created yet"""
+        # warm_up() may be moving screens between the dicts
+        with self._build_lock:
+            return list(self._screens) + list(self._factories)
+
     @property
     def active_screen_id(self):
         return self._active_screen
@@ -458,6 +570,14 @@ class GfxApp(object):
     def active_screen(self):
         return self._screens[self._active_screen]
 
+    @property
+    def is_dirty(self) -> bool:
+        """True if the active screen has changed since it was last rendered"""
+        return self._is_dirty or self.active_screen.is_dirty
+
+    def invalidate(self):
+        self._is_dirty = True
+
     def stop(self):
         self._alive = False
 
@@ -466,18 +586,70 @@ class GfxApp(object):
             self.add_screen(screen)
 
     def add_screen(self, screen: Screen):
-        self._screens[screen.screen_id] = screen
+        with self._build_lock:
+            self._screens[screen.screen_id] = screen
         if not self.active_screen_id:
             self.navigate_to(screen.screen_id)
 
+    def add_screen_factory(self, screen_id: str, factory: Callable[[], Screen]):
+        """
+        Registers a screen that is only created once it is navigated to
+        (or by warm_up())
+        :param screen_id: ID of the screen returned by the factory
+        :param factory: Callable creating the screen
+        """
+        with self._build_lock:
+            self._factories[screen_id] = factory
+
     def remove_screen(self, screen_id: str):
         if screen_id == self.active_screen_id:
             raise ScreenStillActiveException()
-        del self._screens[screen_id]
+        with self._build_lock:
+            if screen_id in self._factories:
+                del self._factories[screen_id]
+            else:
+                del self._screens[screen_id]
+
+    def _build_screen(self, screen_id: str) -> bool:
+        """
+        Creates a screen registered through a factory, unless it exists
+        :return: False if there is no screen with the given ID
+        """
+        # Both dicts are only changed while holding the lock, so a screen
+        # built by another thread is always found in one of them
+        with self._build_lock:
+            if screen_id in self._screens:
+                return True
+            factory = self._factories.get(screen_id)
+            if not factory:
+                return False
+            self._screens[screen_id] = factory()
+            del self._factories[screen_id]
+            return True
+
+    def warm_up(self, background: bool = False) -> Optional[Thread]:
+        """
+        Creates all screens registered through factories and loads their
+        images, so navigating to them later does not stall a frame
+        :param background: Run on a background thread
+        :return: The thread, if running in the background
+        """
+        def run():
+            for screen_id in self.screen_ids:
+                self._build_screen(screen_id)
+            get_assets().warm_up()
+
+        if not background:
+            run()
+            return None
+        thread = Thread(target=run, name='ScreenWarmUp', daemon=True)
+        thread.start()
+        return thread
 
     def navigate_to(self, screen_id: str, skip_events: bool = False):
-        if screen_id not in self._screens:
-            raise KeyError()
+        # Built screens are never moved, only the others need the lock
+        if screen_id not in self._screens and not self._build_screen(screen_id):
+            raise KeyError(screen_id)
 
         if not skip_events and self.active_screen_id:
             self.active_screen.on_navigate_away(screen_id)
@@ -485,17 +657,40 @@ class GfxApp(object):
         old_screen_id = self.active_screen.screen_id if self._active_screen \
             else None
         self._active_screen = screen_id
+        self._is_dirty = True
 
         if not skip_events:
             self.active_screen.on_navigate_to(old_screen_id)
 
     def render(self, draw: ImageDraw.ImageDraw, image: Image.Image):
         self.active_screen.render(draw, image)
+        self._is_dirty = False
 
     def update(self, now: datetime):
         self.active_screen.update(now, self)
 
-    def handle_input(self, button, event):
+    def process_input(self) -> int:
+        """
+        Handles all queued input events
+        :return: Number of handled events
+        """
+        events = self._input_queue.drain()
+        for event in events:
+            self.handle_input(event.button, event.event, event.timestamp)
+        return len(events)
+
+    def take_input_tags(self) -> List[InputTag]:
+        """
+        Returns and forgets the events handled since the last call
+        """
+        tags, self._input_tags = self._input_tags, []
+        return tags
+
+    def handle_input(self, button, event, timestamp: int = None):
+        # Tagged to measure the time until the result reaches the display
+        self._input_tags.append(InputTag(button, event,
+                                         perf_counter_ns() if timestamp is None else timestamp,
+                                         self.active_screen_id))
         if event == input.EVT_PRESS:
             #self.active_screen.on_button_pressed(self, button)
             self._handle_button_pressed(button)
@@ -0,0 +1,141 @@
+from time import monotonic
+from typing import List, Optional, Tuple
+
+from gfxlib.backend import Backend, get_backend, LED_COUNT
+
+
+class BlinkPattern(object):
+    """
+    Sequence of states (LED states or backlight colors) cycling at a fixed interval
+    """
+
+    def __init__(self, states: list, interval: float):
+        """
+        :param states: States to cycle through
+        :param interval: Seconds each state is held
+        """
+        self._states = list(states)
+        self._interval = interval
+
+    def state_at(self, elapsed: float):
+        """
+        :param elapsed: Seconds since the pattern has been started
+        :return: State active at that time
+        """
+        return self._states[int(elapsed / self._interval) % len(self._states)]
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, BlinkPattern) \
+            and self._states == other._states and self._interval == other._interval
+
+    def __hash__(self) -> int:
+        return hash((tuple(self._states), self._interval))
+
+
+class _Output(object):
+    """Desired and last written state of a single output"""
+    __slots__ = ('desired', 'started', 'written')
+
+    def __init__(self, desired=None):
+        self.desired = desired
+        self.started = 0.0
+        self.written = None
+
+    def set(self, desired, now: float):
+        if desired != self.desired:
+            self.desired = desired
+            # A pattern keeps its phase while it is set again every frame
+            self.started = now
+
+    def resolve(self, now: float):
+        if isinstance(self.desired, BlinkPattern):
+            return self.desired.state_at(now - self.started)
+        return self.desired
+
+
+class PeripheralState(object):
+    """
+    Keeps the desired state of the backlight and the button LEDs. Screens
+    may set it as often as they like, flush() (called once per frame by
+    the pipeline) only sends what has actually changed since the last
+    write, so every change costs at most one transaction per frame.
+    """
+
+    def __init__(self, backend: Backend = None):
+        self._backend = backend or get_backend()
+        self._backlight = _Output()
+        self._leds = [_Output(0) for _ in range(LED_COUNT)]
+        self._writes = 0
+
+    @property
+    def writes(self) -> int:
+        """Number of transactions sent to the backend"""
+        return self._writes
+
+    @property
+    def backlight(self) -> Optional[Tuple[int, int, int]]:
+        """Backlight color as of the last flush()"""
+        return self._backlight.written
+
+    @property
+    def leds(self) -> List[int]:
+        """LED states as of the last flush()"""
+        return [led.written for led in self._leds]
+
+    def set_backlight(self, r: int, g: int, b: int):
+        self._backlight.set((r, g, b), monotonic())
+
+    def set_backlight_pattern(self, pattern: BlinkPattern):
+        """
+        :param pattern: Pattern of (r, g, b) colors
+        """
+        self._backlight.set(pattern, monotonic())
+
+    def set_led(self, led: int, state):
+        """
+        :param led: LED index (0 - 5)
+        :param state: 0/1 or a BlinkPattern of those
+        """
+        self._leds[led].set(state if isinstance(state, BlinkPattern) else (1 if state else 0), monotonic())
+
+    def set_leds(self, states: list):
+        for led, state in enumerate(states):
+            self.set_led(led, state)
+
+    def flush(self, now: float = None) -> int:
+        """
+        Sends all changed outputs to the backend
+        :param now: time.monotonic(), used to evaluate blink patterns
+        :return: Number of transactions sent
+        """
+        now = monotonic() if now is None else now
+        writes = 0
+        for led, output in enumerate(self._leds):
+            state = output.resolve(now)
+            if state is not None and state != output.written:
+                self._backend.set_led(led, state)
+                output.written = state
+                writes += 1
+
+        color = self._backlight.resolve(now)
+        if color is not None and color != self._backlight.written:
+            self._backend.set_backlight(*color)
+            self._backend.show_backlight()
+            self._backlight.written = color
+            writes += 1
+
+        self._writes += writes
+        return writes
+
+
+_PERIPHERALS: PeripheralState = None
+
+
+def get_peripherals() -> PeripheralState:
+    """
+    Returns the process-wide peripheral state of the current backend
+    """
+    global _PERIPHERALS
+    if _PERIPHERALS is None or _PERIPHERALS._backend is not get_backend():
+        _PERIPHERALS = PeripheralState(get_backend())
+    return _PERIPHERALS
@@ -1,11 +1,16 @@
-from typing import List, Tuple
+from array import array
+from typing import Dict, List, Tuple
 
 from PIL import Image, ImageDraw, ImageChops
-from datetime import datetime, timedelta
-from gfxhat import lcd, touch
-from time import sleep
+from datetime import datetime
+from time import perf_counter_ns
 
+from gfxlib.backend import get_backend
+from gfxlib.display import Display, LCD_PAGE_HEIGHT, BIT_REVERSE
+from gfxlib.latency import InputLatencyStats
 from gfxlib.objects import RenderObject, GfxApp
+from gfxlib.peripherals import PeripheralState, get_peripherals
+from gfxlib.scheduler import FrameScheduler
 
 PIPETIME_UPDATE = 0
 PIPETIME_CLEAR = 1
@@ -13,6 +18,24 @@ PIPETIME_PROCESS = 2
 PIPETIME_RENDER = 3
 PIPETIME_COMPLETE = 10
 
+PIPETIME_STAGES = [
+    PIPETIME_UPDATE,
+    PIPETIME_CLEAR,
+    PIPETIME_PROCESS,
+    PIPETIME_RENDER,
+    PIPETIME_COMPLETE
+]
+PIPETIME_NAMES = {
+    PIPETIME_UPDATE: 'update',
+    PIPETIME_CLEAR: 'clear',
+    PIPETIME_PROCESS: 'process',
+    PIPETIME_RENDER: 'render',
+    PIPETIME_COMPLETE: 'sleep'
+}
+
+TIMING_BUFFER_SIZE = 512
+TIMING_REPORT_INTERVAL = 100
+
 
 ORIENT_LANDSCAPE = 0b00
 ORIENT_PORTRAIT = 0b10
@@ -23,14 +46,21 @@ ORIENT_PORTRAIT_INVERT = ORIENT_PORTRAIT | ORIENT_INVERT
 
 ORIENT_DEFAULT = ORIENT_LANDSCAPE
 
+# Transposition turning a frame into display orientation
+ORIENT_TRANSPOSE = {
+    ORIENT_LANDSCAPE: None,
+    ORIENT_LANDSCAPE_INVERT: Image.ROTATE_180,
+    ORIENT_PORTRAIT: Image.ROTATE_90,
+    ORIENT_PORTRAIT_INVERT: Image.ROTATE_270
+}
+
 
 MODIFIER_NONE = 0b0
 MODIFIER_COLOR_INVERTED = 0b1
 MODIFIER_DRAW_IN_DIFF_MODE = 0b10
 
-LCD_SIZE = lcd.dimensions()
-
 PT = ([0] + ([255] * 255))
+PT_INVERTED = ([255] + ([0] * 255))
 
 
 def is_portrait(orient: int) -> bool:
@@ -53,71 +83,199 @@ def is_using_diff(modifier: int) -> bool:
     return not (not modifier & MODIFIER_DRAW_IN_DIFF_MODE)
 
 
+def pack_frame(frame: Image.Image) -> bytes:
+    """
+    Converts a 1-bit frame in display orientation into the page format
+    of the display controller (one byte per column and page, 8 vertical
+    pixels per byte, pages ordered top to bottom)
+    :param frame: 1-bit image, its height has to be a multiple of 8
+    :return: Display buffer contents
+    """
+    pages = frame.size[1] // LCD_PAGE_HEIGHT
+    # After transposing, every row holds one display column, so each
+    # packed row yields the bytes of all pages for that column
+    columns = frame.transpose(Image.TRANSPOSE).tobytes().translate(BIT_REVERSE)
+    return b''.join(columns[page::pages] for page in range(pages))
+
+
+def unpack_frame(data: bytes, size: Tuple[int, int]) -> Image.Image:
+    """
+    Converts display buffer contents back into a 1-bit frame in display
+    orientation (the inverse of pack_frame)
+    :param data: Display buffer contents
+    :param size: Size of the frame
+    :return: 1-bit image
+    """
+    width, height = size
+    pages = height // LCD_PAGE_HEIGHT
+    columns = bytearray(len(data))
+    for page in range(pages):
+        columns[page::pages] = data[page * width:(page + 1) * width]
+    frame = Image.frombytes('1', (height, width), bytes(columns).translate(BIT_REVERSE))
+    return frame.transpose(Image.TRANSPOSE)
+
+
+def get_changed_regions(old_frame: Image.Image,
+                        new_frame: Image.Image) -> List[Tuple[int, int, int]]:
+    """
+    Compares two 1-bit frames in display orientation and returns the
+    changed column range of every display page that differs
+    :param old_frame: Frame currently shown on the display
+    :param new_frame: Frame to be shown
+    :return: List of (page, start column, end column (exclusive))
+    """
+    diff = ImageChops.difference(old_frame, new_frame)
+    bbox = diff.getbbox()
+    if not bbox:
+        return []
+
+    regions = []
+    for page in range(bbox[1] // LCD_PAGE_HEIGHT,
+                      (bbox[3] - 1) // LCD_PAGE_HEIGHT + 1):
+        page_bbox = diff.crop((bbox[0], page * LCD_PAGE_HEIGHT,
+                               bbox[2], (page + 1) * LCD_PAGE_HEIGHT)).getbbox()
+        if page_bbox:
+            regions.append((page, bbox[0] + page_bbox[0], bbox[0] + page_bbox[2]))
+    return regions
+
+
 class RenderPipelineTimings(object):
-    def __init__(self):
-        self._timing_start = datetime.now()
-        self._timing_update = datetime.min
-        self._timing_clear = datetime.min
-        self._timing_process = datetime.min
-        self._timing_render = datetime.min
-        self._timing_completed = datetime.min
+    """
+    Collects the duration of every pipeline stage in preallocated ring
+    buffers (one slot per frame) using a monotonic nanosecond clock.
+    The properties return the values of the last completed frame in ms.
+    """
+
+    def __init__(self, capacity: int = TIMING_BUFFER_SIZE):
+        self._capacity = capacity
+        self._durations = {stage: array('q', bytes(8 * capacity))
+                           for stage in PIPETIME_STAGES}
+        self._totals = array('q', bytes(8 * capacity))
+        self._index = 0
+        self._count = 0
+        self._frame_start = 0
+        self._last_hit = 0
+
+    def start(self):
+        self._frame_start = self._last_hit = perf_counter_ns()
+
+    def hit(self, stage: int):
+        now = perf_counter_ns()
+        self._durations[stage][self._index] = now - self._last_hit
+        self._last_hit = now
+
+    def finish(self):
+        self._totals[self._index] = self._last_hit - self._frame_start
+        self._index = (self._index + 1) % self._capacity
+        self._count = min(self._count + 1, self._capacity)
 
-    def hit_clear(self):
-        self._timing_clear = datetime.now()
+    @property
+    def frame_count(self) -> int:
+        """Number of frames held in the buffers"""
+        return self._count
 
-    def hit_update(self):
-        self._timing_update = datetime.now()
+    @property
+    def frame_start(self) -> int:
+        """perf_counter_ns() at the start of the current frame"""
+        return self._frame_start
 
-    def hit_process(self):
-        self._timing_process = datetime.now()
+    def _last(self, buffer: array) -> float:
+        return buffer[self._index - 1] / 1000000 if self._count else 0.0
 
-    def hit_render(self):
-        self._timing_render = datetime.now()
+    @property
+    def total_time(self) -> float:
+        return self._last(self._totals)
 
-    def hit_complete(self):
-        self._timing_completed = datetime.now()
+    @property
+    def update_time(self) -> float:
+        return self._last(self._durations[PIPETIME_UPDATE])
 
     @property
-    def start_time(self):
-        return self._timing_start
+    def clear_time(self) -> float:
+        return self._last(self._durations[PIPETIME_CLEAR])
 
     @property
-    def total_time(self):
-        return (self._timing_completed - self._timing_start).total_seconds() * 1000
+    def process_time(self) -> float:
+        return self._last(self._durations[PIPETIME_PROCESS])
 
     @property
-    def update_time(self):
-        return (self._timing_update - self._timing_start).total_seconds() * 1000
+    def render_time(self) -> float:
+        return self._last(self._durations[PIPETIME_RENDER])
 
     @property
-    def clear_time(self):
-        return (self._timing_clear - self._timing_update).total_seconds() * 1000
+    def complete_time(self) -> float:
+        return self._last(self._durations[PIPETIME_COMPLETE])
+
+    def percentiles(self, stage: int = None) -> Dict[str, float]:
+        """
+        Calculates min, p50, p95, p99 and max over all buffered frames
+        :param stage: PIPETIME_* constant, None for the whole frame
+        :return: Dictionary of statistic name and value in ms
+        """
+        buffer = self._totals if stage is None else self._durations[stage]
+        values = sorted(buffer[:self._count] if self._count < self._capacity else buffer)
+        if not values:
+            return {key: 0.0 for key in ['min', 'p50', 'p95', 'p99', 'max']}
+
+        def pick(pct: float) -> float:
+            return values[min(len(values) - 1, int(len(values) * pct))] / 1000000
+
+        return {
+            'min': values[0] / 1000000,
+            'p50': pick(0.5),
+            'p95': pick(0.95),
+            'p99': pick(0.99),
+            'max': values[-1] / 1000000
+        }
+
+    def report(self) -> str:
+        lines = ['Timings over {} frame(s) [ms]:'.format(self._count)]
+        for name, stage in [('total', None)] + [(PIPETIME_NAMES[stage], stage) for stage in PIPETIME_STAGES]:
+            lines.append('  {:<8} min {min:6.2f}  p50 {p50:6.2f}  p95 {p95:6.2f}  '
+                         'p99 {p99:6.2f}  max {max:6.2f}'.format(name, **self.percentiles(stage)))
+        return '\n'.join(lines)
+
+    def __str__(self) -> str:
+        return 'Cycle completed in {:0.1f} ms (slept for {:0.1f} ms)'.format(self.total_time, self.complete_time)
+
+
+class FrameBufferPool(object):
+    """
+    Small pool of reusable frame buffers. Frames are drawn into the back
+    buffer; after a swap the previously drawn frame stays available
+    until its buffer gets reused.
+    """
+
+    def __init__(self, size: Tuple[int, int], count: int = 2):
+        self._box = (0, 0, size[0], size[1])
+        self._images = [Image.new('P', size) for _ in range(count)]
+        self._draws = [ImageDraw.Draw(image) for image in self._images]
+        self._index = 0
+        self._has_previous = False
 
     @property
-    def process_time(self):
-        return (self._timing_process - self._timing_clear).total_seconds() * 1000
+    def image(self) -> Image.Image:
+        return self._images[self._index]
 
     @property
-    def render_time(self):
-        return (self._timing_render - self._timing_process).total_seconds() * 1000
+    def draw(self) -> ImageDraw.ImageDraw:
+        return self._draws[self._index]
 
     @property
-    def complete_time(self):
-        return (self._timing_completed - self._timing_render).total_seconds() * 1000
+    def previous_image(self) -> Image.Image:
+        """Frame drawn before the current one or None if it has been overwritten"""
+        return self._images[self._index - 1] if self._has_previous else None
 
-    def __str__(self) -> str:
-        if self._timing_completed != datetime.min:
-            return 'Cycle completed in {:0.1f} ms (slept for {:0.1f} ms)'.format(self.total_time, self.complete_time)
-        if self._timing_render != datetime.min:
-            return 'Rendered in {:0.1f} ms'.format(self.render_time)
-        if self._timing_process != datetime.min:
-            return 'Processed in {:0.1f} ms'.format(self.process_time)
-        if self._timing_clear != datetime.min:
-            return 'Cleared in {:0.1f} ms'.format(self.clear_time)
-        if self._timing_update != datetime.min:
-            return 'Updated in {:0.1f} ms'.format(self.update_time)
+    def clear(self):
+        """Clears the back buffer in place"""
+        self.image.paste(0, self._box)
+        self._has_previous = False
 
-        return 'Started at {}'.format(self._timing_start)
+    def swap(self):
+        """Moves on to the next buffer and clears it, keeping the current frame"""
+        self._index = (self._index + 1) % len(self._images)
+        self.image.paste(0, self._box)
+        self._has_previous = True
 
 
 class RenderPipeline(object):
@@ -128,178 +286,197 @@ class RenderPipeline(object):
                  enable_reinit=False,
                  fps_limit=0,
                  orientation=ORIENT_DEFAULT,
-                 modifiers=MODIFIER_NONE
+                 modifiers=MODIFIER_NONE,
+                 display: Display = None,
+                 scheduler: FrameScheduler = None,
+                 sinks: list = None,
+                 peripherals: PeripheralState = None
                  ):
+        self._display = display or get_backend().display
         if not screen_size:
-            screen_size = lcd.dimensions()
+            screen_size = self._display.dimensions
         if orientation == ORIENT_PORTRAIT or orientation == ORIENT_PORTRAIT_INVERT:
             screen_size = (screen_size[1], screen_size[0])
 
         self._orientation = orientation
+        self._orientation_transpose = ORIENT_TRANSPOSE[orientation]
         self._modifiers = modifiers
+        self._rendered_modifiers = None
 
         self._image_size = screen_size
-        self._image = Image.new('P', self._image_size)
-        self._draw = ImageDraw.Draw(self._image)
+        self._frames = FrameBufferPool(self._image_size)
 
-        self._last_image = Image.new('P', self._image_size)
+        self._last_frame: Image.Image = None
 
         self._app: GfxApp = app
 
-        self._current_timing: RenderPipelineTimings = None
-        self._last_timing: RenderPipelineTimings = None
+        self._timings = RenderPipelineTimings()
+        self._input_latency = InputLatencyStats()
+        self._reported_bytes = 0
 
         self._use_reinit = enable_reinit
-        self._frame_sleep_time = 0 if fps_limit <= 0 else 1 / fps_limit
-        self._enable_timing = enable_timing or (fps_limit > 0)
+        self._fps_limit = fps_limit
+        self._scheduler = scheduler or FrameScheduler(fps_limit)
+        # Draw the response to an input right away instead of on the next tick
+        self._app.input_queue.add_listener(self._scheduler.wake)
+        self._enable_timing = enable_timing
+        self._sinks = list(sinks or [])
+        self._peripherals = peripherals or get_peripherals()
 
         self._frame_counter = 0
 
     def set_modifiers(self, modifiers: int):
         self._modifiers = modifiers
 
+    def add_sink(self, sink):
+        """
+        Registers an object receiving every frame sent to the display
+        :param sink: Object with a write(frame) method, e.g. a FrameRecorder
+        """
+        self._sinks.append(sink)
+
+    def close(self):
+        """
+        Detaches the pipeline from the app, which may then be driven by another one
+        """
+        self._app.input_queue.remove_listener(self._scheduler.wake)
+
+    @property
+    def display(self) -> Display:
+        return self._display
+
+    @property
+    def scheduler(self) -> FrameScheduler:
+        return self._scheduler
+
+    @property
+    def frame_time(self) -> RenderPipelineTimings:
+        return self._timings
+
     @property
-    def frame_time(self):
-        return self._last_timing
+    def input_latency(self) -> InputLatencyStats:
+        return self._input_latency
 
     @property
     def is_timing_enabled(self):
         return self._enable_timing
 
     def _start_timing(self):
-        if self._enable_timing:
-            self._current_timing = RenderPipelineTimings()
+        self._timings.start()
 
     def _register_timing(self, pos):
-        if self._enable_timing and self._current_timing:
-            if pos == PIPETIME_UPDATE:
-                self._current_timing.hit_update()
-            elif pos == PIPETIME_CLEAR:
-                self._current_timing.hit_clear()
-            elif pos == PIPETIME_PROCESS:
-                self._current_timing.hit_process()
-            elif pos == PIPETIME_RENDER:
-                self._current_timing.hit_render()
-            elif pos == PIPETIME_COMPLETE:
-                self._current_timing.hit_complete()
+        self._timings.hit(pos)
 
     def _finish_timing(self):
-        if self._enable_timing and self._current_timing:
-            self._last_timing = self._current_timing
-            print(self._last_timing)
+        self._timings.finish()
+        if self._enable_timing and (self._frame_counter + 1) % TIMING_REPORT_INTERVAL == 0:
+            sent = self._display.total_bytes_sent - self._reported_bytes
+            self._reported_bytes = self._display.total_bytes_sent
+            print(self._timings.report())
+            print('  {:0.0f} bytes sent per frame, {:0.1f} fps target, '
+                  '{} missed deadline(s), {} dropped frame(s)'.format(sent / TIMING_REPORT_INTERVAL,
+                                                                     self._scheduler.fps,
+                                                                     self._scheduler.missed_deadlines,
+                                                                     self._scheduler.dropped_frames))
+            if self._input_latency.total.count or self._input_latency.unchanged:
+                print(self._input_latency.report())
 
     def _update(self):
+        self._app.process_input()
         now = datetime.now()
         self._app.update(now)
         self._register_timing(PIPETIME_UPDATE)
 
     def _clear(self):
-        for x in range(self._image_size[0]):
-            for y in range(self._image_size[1]):
-                self._image.putpixel((x, y), 0)
+        self._frames.clear()
         self._register_timing(PIPETIME_CLEAR)
 
     def _reinit(self):
-        if is_using_diff(self._modifiers):
-            self._last_image = self._image
-
-        self._image = Image.new('P', self._image_size)
-        self._draw = ImageDraw.Draw(self._image)
+        self._frames.swap()
         self._register_timing(PIPETIME_CLEAR)
 
     def _process(self):
-        self._app.render(self._draw, self._image)
+        self._app.render(self._frames.draw, self._frames.image)
         self._register_timing(PIPETIME_PROCESS)
 
-    #def _run_image_dif(self) -> Image:
-    #    orig = self._last_image
-    #    updated = self._image
-    #
-    #    diff = ImageChops.difference(orig, updated).getbbox()\
-    #        .convert('L')\
-    #        .point(PT)
-    #    new = diff.convert('P')
-    #    new.paste(updated, mask=diff)
-    #    return new
-
-    def _get_changed_pixels(self) -> List[Tuple[int, int]]:
-        orig = self._last_image
-        updated = self._image
-        coords = []
-        for x in range(orig.size[0]):
-            for y in range(orig.size[1]):
-                orig_pix = orig.getpixel((x, y))
-                updated_pix = updated.getpixel((x, y))
-                if orig_pix != updated_pix:
-                    coords.append((x, y))
-        return coords
-
     def _render(self):
-        portrait = is_portrait(self._orientation)
-        inverted = is_inverted(self._orientation)
-
         color_inverted = is_color_inverted(self._modifiers)
         use_diff = is_using_diff(self._modifiers)
 
-        if use_diff:
-            delta_list = self._get_changed_pixels()
-            for coord in delta_list:
-                lcd_coords = self._process_screen_coord(coord, portrait)
-                pix_coords = self._process_image_coord(coord, inverted)
-                self._render_pixel(lcd_coords, pix_coords,
-                                   color_inverted)
+        if use_diff and not self._has_image_changed():
+            frame = self._last_frame
+        elif use_diff:
+            if self._last_frame is None:
+                # Start from whatever the display buffer holds
+                self._last_frame = unpack_frame(self._display.buffer, self._display.dimensions)
+            frame = self._get_display_frame(color_inverted)
+            # Only the changed span of each changed page gets packed;
+            # the regions are exact, so the display does not compare again
+            for page, x_start, x_end in get_changed_regions(self._last_frame, frame):
+                region = frame.crop((x_start, page * LCD_PAGE_HEIGHT,
+                                     x_end, (page + 1) * LCD_PAGE_HEIGHT))
+                self._display.write(page, x_start, pack_frame(region), compare=False)
         else:
-            for x in range(0, self._image_size[0], 1):
-                for y in range(0, self._image_size[1], 1):
-                    lcd_coords = self._process_screen_coord((x, y), portrait)
-                    pix_coords = self._process_image_coord((x, y), inverted)
-
-                    self._render_pixel(lcd_coords, pix_coords, color_inverted)
-
-        # Flush Display Buffer
-        lcd.show()
+            frame = self._get_display_frame(color_inverted)
+            self._display.write_frame(pack_frame(frame))
+        self._last_frame = frame
+        self._rendered_modifiers = self._modifiers
+
+        # Flush dirty pages of the Display Buffer
+        self._display.show()
+        # Inputs handled during this step are now visible, unless
+        # they did not change anything
+        tags = self._app.take_input_tags()
+        if self._display.bytes_sent:
+            self._input_latency.record(tags, perf_counter_ns())
+        else:
+            self._input_latency.record_unchanged(tags)
+        for sink in self._sinks:
+            sink.write(frame)
+        self._register_timing(PIPETIME_RENDER)
 
-        # Do the timing
+    def _skip(self):
+        self._input_latency.record_unchanged(self._app.take_input_tags())
+        self._register_timing(PIPETIME_CLEAR)
+        self._register_timing(PIPETIME_PROCESS)
         self._register_timing(PIPETIME_RENDER)
-        if self._frame_sleep_time > 0:
-            delta = datetime.now() - self._current_timing.start_time
-            sleep_dur = self._frame_sleep_time - (delta.total_seconds() * 1000 / 1000) - 0.001
-            if sleep_dur > 0:
-                sleep(sleep_dur)
+
+    def _wait(self):
+        screen_fps = self._app.active_screen.target_fps
+        self._scheduler.set_rate(screen_fps if screen_fps is not None else self._fps_limit)
+        self._scheduler.wait()
         self._register_timing(PIPETIME_COMPLETE)
 
-    def _process_screen_coord(self,
-                              coord: Tuple[int, int],
-                              portrait: bool = False):
-        if portrait:
-            coord = (min(coord[1], LCD_SIZE[0]),
-                     min(self._image_size[0] - coord[0] - 1, LCD_SIZE[1]))
-        return coord
-
-    def _process_image_coord(self,
-                             coord: Tuple[int, int],
-                             inverted: bool = False):
-        if inverted:
-            coord = (self._image_size[0] - 1 - coord[0],
-                     self._image_size[1] - 1 - coord[1])
-        return coord
-
-    def _render_pixel(self,
-                      screen_coord: Tuple[int, int],
-                      image_coord: Tuple[int, int],
-                      color_inverted: bool = False):
-        pix = self._image.getpixel(image_coord)
-        if color_inverted:
-            pix = 0 if pix else 1
-        lcd.set_pixel(screen_coord[0], screen_coord[1], pix)
+    def _has_image_changed(self) -> bool:
+        previous = self._frames.previous_image
+        if previous is None or self._last_frame is None or self._modifiers != self._rendered_modifiers:
+            return True
+        return ImageChops.difference(previous, self._frames.image).getbbox() is not None
+
+    def _get_display_frame(self, color_inverted: bool = False) -> Image.Image:
+        frame = self._frames.image.point(PT_INVERTED if color_inverted else PT, '1')
+        if self._orientation_transpose is not None:
+            frame = frame.transpose(self._orientation_transpose)
+        return frame
+
+    def _needs_redraw(self) -> bool:
+        return self._app.is_dirty or self._modifiers != self._rendered_modifiers
 
     def loop_step(self):
         self._start_timing()
+        self._display.start_frame()
 
         self._update()
-        self._clear() if not self._use_reinit else self._reinit()
-        self._process()
-        self._render()
+        if self._needs_redraw():
+            self._clear() if not self._use_reinit else self._reinit()
+            self._process()
+            self._render()
+        else:
+            # Nothing has changed, the display already shows this frame
+            self._skip()
+        # Backlight and LED changes of this frame go out in one go
+        self._peripherals.flush()
+        self._wait()
 
         self._finish_timing()
         self._frame_counter += 1
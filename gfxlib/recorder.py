@@ -0,0 +1,241 @@
+"""
+Records the frames sent to the display into a fixed-size ring file and
+plays them back, e.g. to see what was drawn when a glitch got reported.
+
+Usage: python3 -m gfxlib.recorder <file> [--export DIR] [--first N] [--last N]
+"""
+from argparse import ArgumentParser
+from mmap import mmap, ACCESS_READ
+from os.path import join
+from struct import Struct
+from time import time_ns
+from typing import Optional, Tuple
+
+from PIL import Image
+
+from gfxlib.display import get_changed_span, LCD_SIZE
+
+RECORDING_MAGIC = b'CPFR'
+RECORDING_VERSION = 1
+
+# Number of frames kept by default, about 6 minutes at 10 fps
+DEFAULT_CAPACITY = 3600
+# Every n-th frame of a delta recording is stored completely, so
+# seeking never has to replay more than n - 1 deltas
+DEFAULT_KEYFRAME_INTERVAL = 50
+
+FRAME_KEY = 0
+FRAME_DELTA = 1
+
+# magic, version, width, height, use delta, capacity, keyframe interval, frames written
+HEADER = Struct('<4sHHHBIIQ')
+# timestamp (ns since epoch), frame type, start, end of the stored bytes
+SLOT_HEADER = Struct('<qBHH')
+
+
+def _frame_bytes(size: Tuple[int, int]) -> int:
+    return (size[0] + 7) // 8 * size[1]
+
+
+class FrameRecorder(object):
+    """
+    Pipeline sink appending every rendered frame to a memory-mapped ring
+    file, either as packed 1-bit bitmap or as XOR delta against the
+    previous frame. Once the ring is full the oldest frames get
+    overwritten.
+    """
+
+    def __init__(self, file: str,
+                 capacity: int = DEFAULT_CAPACITY,
+                 use_delta: bool = False,
+                 size: Tuple[int, int] = LCD_SIZE,
+                 keyframe_interval: int = DEFAULT_KEYFRAME_INTERVAL):
+        """
+        :param file: Recording to create, an existing file gets replaced
+        :param capacity: Number of frames kept
+        :param use_delta: Store XOR deltas between keyframes
+        :param size: Frame size
+        :param keyframe_interval: Frames between two keyframes (delta only)
+        """
+        self._size = size
+        self._frame_size = _frame_bytes(size)
+        self._slot_size = SLOT_HEADER.size + self._frame_size
+        self._capacity = capacity
+        self._use_delta = use_delta
+        self._keyframe_interval = keyframe_interval
+        self._frames_written = 0
+        self._previous: Optional[bytes] = None
+
+        self._file = open(file, 'w+b')
+        self._file.truncate(HEADER.size + capacity * self._slot_size)
+        self._map = mmap(self._file.fileno(), 0)
+        self._write_header()
+
+    @property
+    def frames_written(self) -> int:
+        return self._frames_written
+
+    def _write_header(self):
+        HEADER.pack_into(self._map, 0, RECORDING_MAGIC, RECORDING_VERSION,
+                         self._size[0], self._size[1], self._use_delta,
+                         self._capacity, self._keyframe_interval, self._frames_written)
+
+    def write(self, frame: Image.Image):
+        """
+        Appends a frame
+        :param frame: 1-bit frame as sent to the display
+        """
+        data = frame.tobytes()
+        number = self._frames_written
+        offset = HEADER.size + (number % self._capacity) * self._slot_size
+
+        if self._use_delta and self._previous is not None and number % self._keyframe_interval:
+            # Only the changed byte range is stored
+            start, end = get_changed_span(self._previous, data) or (0, 0)
+            delta = int.from_bytes(data[start:end], 'big') ^ int.from_bytes(self._previous[start:end], 'big')
+            kind, span, payload = FRAME_DELTA, (start, end), delta.to_bytes(end - start, 'big')
+        else:
+            kind, span, payload = FRAME_KEY, (0, self._frame_size), data
+
+        SLOT_HEADER.pack_into(self._map, offset, time_ns(), kind, span[0], span[1])
+        payload_offset = offset + SLOT_HEADER.size
+        self._map[payload_offset:payload_offset + len(payload)] = payload
+
+        self._previous = data
+        self._frames_written = number + 1
+        self._write_header()
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        if self._map.closed:
+            return
+        self._map.flush()
+        self._map.close()
+        self._file.close()
+
+
+class FramePlayer(object):
+    """
+    Reads a recording written by FrameRecorder. Frames are addressed by
+    their number since the start of the recording; only the frames still
+    held by the ring can be loaded.
+    """
+
+    def __init__(self, file: str):
+        self._file = open(file, 'rb')
+        self._map = mmap(self._file.fileno(), 0, access=ACCESS_READ)
+        magic, version, width, height, use_delta, capacity, keyframe_interval, frames_written = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != RECORDING_MAGIC or version != RECORDING_VERSION:
+            raise ValueError('{} is not a frame recording'.format(file))
+
+        self._size = (width, height)
+        self._frame_size = _frame_bytes(self._size)
+        self._slot_size = SLOT_HEADER.size + self._frame_size
+        self._capacity = capacity
+        self._use_delta = bool(use_delta)
+        self._keyframe_interval = keyframe_interval
+        self._frames_written = frames_written
+        self._cached: Tuple[int, bytes] = (-1, b'')
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self._size
+
+    @property
+    def first_frame(self) -> int:
+        """Number of the oldest frame that can be loaded"""
+        first = max(0, self._frames_written - self._capacity)
+        if self._use_delta and first % self._keyframe_interval:
+            # Deltas whose keyframe has been overwritten cannot be decoded
+            first += self._keyframe_interval - first % self._keyframe_interval
+        return min(first, self._frames_written)
+
+    @property
+    def last_frame(self) -> int:
+        """Number of the newest frame, -1 if nothing has been recorded"""
+        return self._frames_written - 1
+
+    def __len__(self) -> int:
+        return self._frames_written - self.first_frame
+
+    def _read_slot(self, number: int) -> Tuple[int, int, int, int, bytes]:
+        offset = HEADER.size + (number % self._capacity) * self._slot_size
+        timestamp, kind, start, end = SLOT_HEADER.unpack_from(self._map, offset)
+        payload_offset = offset + SLOT_HEADER.size
+        return timestamp, kind, start, end, self._map[payload_offset:payload_offset + end - start]
+
+    def _check(self, number: int):
+        if not self.first_frame <= number <= self.last_frame:
+            raise IndexError('Frame {} is not part of the recording ({} - {})'.format(
+                number, self.first_frame, self.last_frame))
+
+    def timestamp(self, number: int) -> int:
+        """
+        :return: Time the frame was recorded at, in ns since the epoch
+        """
+        self._check(number)
+        return self._read_slot(number)[0]
+
+    def get_frame_data(self, number: int) -> bytes:
+        """
+        Decodes a frame, replaying deltas from the closest keyframe
+        :param number: Frame number
+        :return: Packed 1-bit frame
+        """
+        self._check(number)
+        # Start over at the keyframe preceding the frame, unless the
+        # previously decoded frame lies in between
+        start = number - number % self._keyframe_interval if self._use_delta else number
+        cached_number, cached = self._cached
+        frame = None
+        if self._use_delta and start <= cached_number <= number:
+            start, frame = cached_number + 1, bytearray(cached)
+
+        for current in range(start, number + 1):
+            _, kind, begin, end, payload = self._read_slot(current)
+            if kind == FRAME_KEY:
+                frame = bytearray(payload)
+            else:
+                frame[begin:end] = (int.from_bytes(frame[begin:end], 'big') ^ int.from_bytes(payload, 'big')) \
+                    .to_bytes(end - begin, 'big')
+
+        data = bytes(frame)
+        self._cached = (number, data)
+        return data
+
+    def get_frame(self, number: int) -> Image.Image:
+        return Image.frombytes('1', self._size, self.get_frame_data(number))
+
+    def export_png(self, number: int, file: str):
+        self.get_frame(number).save(file, 'PNG')
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def main():
+    parser = ArgumentParser(description='Shows and exports recorded frames')
+    parser.add_argument('file', help='Recording')
+    parser.add_argument('--export', metavar='DIR', help='Export the frames as PNGs into this directory')
+    parser.add_argument('--first', type=int, help='First frame to export')
+    parser.add_argument('--last', type=int, help='Last frame to export')
+    args = parser.parse_args()
+
+    player = FramePlayer(args.file)
+    print('{} frame(s) ({} - {}), {}x{}'.format(len(player), player.first_frame, player.last_frame,
+                                               *player.size))
+    if args.export and len(player):
+        first = player.first_frame if args.first is None else args.first
+        last = player.last_frame if args.last is None else args.last
+        for number in range(first, last + 1):
+            player.export_png(number, join(args.export, 'frame-{:08d}.png'.format(number)))
+        print('Exported {} frame(s) to {}'.format(last - first + 1, args.export))
+    player.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+from threading import Event
+from time import perf_counter_ns
+
+NS_PER_SECOND = 1000000000
+
+
+class FrameScheduler(object):
+    """
+    Paces frames along a grid of monotonic deadlines. A frame finishing
+    late is followed by the next one right away so the pipeline can
+    catch up, but if a whole frame period has been lost, the missed
+    frames are dropped instead of being rendered back to back.
+    A sleeping scheduler can be woken from another thread, e.g. to draw
+    the response to a button press right away.
+    """
+
+    def __init__(self, fps: float = 0):
+        self._period = 0
+        self._deadline: int = None
+        self._missed_deadlines = 0
+        self._dropped_frames = 0
+        self._wake_event = Event()
+        self.set_rate(fps)
+
+    @property
+    def fps(self) -> float:
+        return NS_PER_SECOND / self._period if self._period else 0
+
+    @property
+    def missed_deadlines(self) -> int:
+        """Number of frames that have finished after their deadline"""
+        return self._missed_deadlines
+
+    @property
+    def dropped_frames(self) -> int:
+        """Number of frames skipped to get back onto the deadline grid"""
+        return self._dropped_frames
+
+    def set_rate(self, fps: float):
+        """
+        Changes the target frame rate, taking effect with the next frame
+        :param fps: Frames per second, 0 to disable pacing
+        """
+        period = int(NS_PER_SECOND / fps) if fps and fps > 0 else 0
+        if period != self._period:
+            self._period = period
+            if not period:
+                self._deadline = None
+
+    def wake(self):
+        """
+        Ends the current (or next) wait early, thread-safe
+        """
+        self._wake_event.set()
+
+    def wait(self):
+        """
+        Sleeps until the deadline of the next frame or until woken up
+        """
+        if not self._period:
+            self._wake_event.clear()
+            return
+
+        now = perf_counter_ns()
+        if self._deadline is None:
+            self._deadline = now
+
+        self._deadline += self._period
+        lateness = now - self._deadline
+        if lateness <= 0:
+            if self._wake_event.wait(-lateness / NS_PER_SECOND):
+                # Restart the deadline grid at the woken frame
+                self._deadline = perf_counter_ns()
+            self._wake_event.clear()
+            return
+
+        self._missed_deadlines += 1
+        if lateness >= self._period:
+            dropped = lateness // self._period
+            self._dropped_frames += dropped
+            self._deadline += dropped * self._period
@@ -1,19 +1,30 @@
+from glob import glob
 from os import path
 
 from PIL import ImageFont
 from PIL.ImageFont import FreeTypeFont
-from gfxhat import fonts
+
+from gfxlib.fonts import BitmapFont
+
+_FONT_FILES = {}
+_BITMAP_FONTS = {}
 
 def init_fonts(dir: str=None):
     if not dir:
         dir = path.abspath(path.join(path.dirname(__file__), '..', 'fonts'))
 
-    fonts.font_directory = dir
-    fonts.font_files = {}
-    fonts.load_fonts("bdf")
+    _FONT_FILES.clear()
+    _BITMAP_FONTS.clear()
+    for file in glob(path.join(dir, '*.bdf')):
+        _FONT_FILES[path.splitext(path.basename(file))[0]] = file
 
 def get_font(key: str):
-    return fonts.font_files[key]
+    return _FONT_FILES[key]
 
 def get_new_font(key: str, size: int) -> FreeTypeFont:
     return ImageFont.truetype(get_font(key), size=size)
+
+def get_bitmap_font(key: str) -> BitmapFont:
+    if key not in _BITMAP_FONTS:
+        _BITMAP_FONTS[key] = BitmapFont(get_font(key))
+    return _BITMAP_FONTS[key]
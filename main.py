@@ -1,9 +1,6 @@
 from os import environ
 from time import sleep
 
-from gfxhat.backlight import set_all as set_all_bg, show as show_bg
-from gfxhat.lcd import clear as clear_screen, show as show_screen
-
 from app.boot import BootScreen
 from app.dialogs.shutdown_request import ShutdownRequestDialog
 from app.fuel_stats import FuelStatsScreen
@@ -12,48 +9,71 @@ from app.shutdown import ShutdownScreen
 from app.test.dialog_test import DialogTestScreen
 from app.value_display import ValueDisplayScreen
 from gfxlib import pipeline
+from gfxlib.backend import get_backend
 from gfxlib.objects import GfxApp
+from gfxlib.peripherals import get_peripherals
+from gfxlib.recorder import FrameRecorder
 
 SKIP_BOOT_SCREEN = environ.get('CARPI_UI_SKIP_BOOT', None) == '1'
 START_WITH_SCREEN = environ.get('CARPI_UI_START_WITH', None)
 ENABLE_TIMING = environ.get('CARPI_UI_PROFILING', None) == '1'
+RECORD_FILE = environ.get('CARPI_UI_RECORD', None)
+RECORD_DELTA = environ.get('CARPI_UI_RECORD_DELTA', None) == '1'
 
-set_all_bg(255, 0, 0)
-show_bg()
+BACKEND = get_backend()
+PERIPHERALS = get_peripherals()
+PERIPHERALS.set_backlight(255, 0, 0)
+PERIPHERALS.flush()
 
 
 APP = GfxApp()
 if not SKIP_BOOT_SCREEN:
     APP.add_screen(BootScreen())
 
-APP.add_screen(FuelStatsScreen())
-APP.add_screen(ValueDisplayScreen())
-APP.add_screen(ShutdownScreen())
-APP.add_screen(MainMenu())
-APP.add_screen(DialogTestScreen())
-APP.add_screen(ShutdownRequestDialog())
+# Only the boot screen is created up front so it reaches the panel
+# quickly, the others are built when first needed or by the warm-up
+APP.add_screen_factory(FuelStatsScreen.ID, FuelStatsScreen)
+APP.add_screen_factory(ValueDisplayScreen.ID, ValueDisplayScreen)
+APP.add_screen_factory(ShutdownScreen.ID, ShutdownScreen)
+APP.add_screen_factory(MainMenu.ID, MainMenu)
+APP.add_screen_factory(DialogTestScreen.ID, DialogTestScreen)
+APP.add_screen_factory(ShutdownRequestDialog.ID, ShutdownRequestDialog)
 
 PIPELINE = pipeline.RenderPipeline(APP,
                                    enable_reinit=True,
                                    enable_timing=ENABLE_TIMING,
                                    fps_limit=10,
                                    orientation=pipeline.ORIENT_LANDSCAPE,
-                                   #modifiers=pipeline.MODIFIER_DRAW_IN_DIFF_MODE
+                                   modifiers=pipeline.MODIFIER_DRAW_IN_DIFF_MODE
                                    )
+RECORDER = FrameRecorder(RECORD_FILE, use_delta=RECORD_DELTA) if RECORD_FILE else None
+if RECORDER:
+    PIPELINE.add_sink(RECORDER)
+
 try:
     if START_WITH_SCREEN:
         APP.navigate_to(START_WITH_SCREEN)
+    elif SKIP_BOOT_SCREEN:
+        APP.navigate_to(FuelStatsScreen.ID)
+
+    # Build the remaining screens once the first frame is shown
+    PIPELINE.loop_step()
+    APP.warm_up(background=True)
 
     while APP.alive:
         PIPELINE.loop_step()
 except KeyboardInterrupt or SystemError or SystemExit:
     pass
 
-clear_screen()
-show_screen()
+PIPELINE.close()
+if RECORDER:
+    RECORDER.close()
+
+BACKEND.display.clear()
+BACKEND.display.show()
 
-set_all_bg(100, 0, 0)
-show_bg()
+PERIPHERALS.set_backlight(100, 0, 0)
+PERIPHERALS.flush()
 
 sleep(1)
 exit(1)
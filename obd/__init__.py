@@ -1,5 +1,14 @@
 
 class ObdRedisKeys:
+    # Pattern matching every key below, used to subscribe to their changes
+    KEY_PATTERN = 'OBD.*'
+    # Channel the names of changed keys may be published on
+    CHANNEL_UPDATES = 'OBD.Updates'
+    # Hash holding all values in the hash storage layout, keyed by
+    # the names below, plus the generation of the last write
+    KEY_SNAPSHOT = 'OBD.Snapshot'
+    KEY_GENERATION = 'OBD.Generation'
+
     KEY_ALIVE = 'OBD.State'
 
     KEY_BATTERY_VOLTAGE = 'OBD.BatteryVoltage'
@@ -0,0 +1,325 @@
+"""
+asyncio counterparts of the helpers in obd.redis, with the same
+semantics. All commands issued through the same client within one
+iteration of the event loop (e.g. by several tasks reading telemetry,
+checking commands and syncing persistent values) are merged into a
+single pipeline, so they share one round trip.
+"""
+from asyncio import ensure_future, gather, get_running_loop
+from threading import Lock
+from weakref import WeakKeyDictionary
+
+from redis.asyncio import Redis, ConnectionPool
+
+from obd import redis as _redis
+from obd.redis import RCONFIG_SECTION, RCONFIG_PERSISTENT_SECTION, \
+    RCONFIG_VALUE_EXPIRE_COMMANDS, get_command_param_key, get_connection_kwargs, load_config, log
+
+# One connection pool per config section, shared by all clients
+_POOLS = {}
+_POOLS_LOCK = Lock()
+# One batcher per event loop and connection pool
+_BATCHERS = WeakKeyDictionary()
+
+
+def _get_pool(config, section):
+    """
+    Returns the process-wide asyncio connection pool of a config section
+    :param ConfigParser config:
+    :param str section:
+    :return ConnectionPool:
+    """
+    with _POOLS_LOCK:
+        pool = _POOLS.get(section)
+        if not pool:
+            pool = ConnectionPool(**get_connection_kwargs(config, section))
+            _POOLS[section] = pool
+        return pool
+
+
+def get_redis(config):
+    """
+    Returns the default Redis connection
+    :param ConfigParser config:
+    :return Redis:
+    """
+    load_config(config)
+    return Redis(connection_pool=_get_pool(config, RCONFIG_SECTION))
+
+
+def get_persistent_redis(config):
+    """
+    Returns the Persistent Redis Connection
+    :param ConfigParser config:
+    :return Redis:
+    """
+    return Redis(connection_pool=_get_pool(config, RCONFIG_PERSISTENT_SECTION))
+
+
+class PipelineBatcher(object):
+    """
+    Collects the commands of all requests made during one iteration of
+    the event loop and sends them as one pipeline once the loop gets to
+    run its scheduled callbacks. Every request still gets its own
+    results; an error of one command only fails the request it belongs to.
+    """
+
+    def __init__(self, r):
+        """
+        :param Redis r: asyncio Redis instance
+        """
+        self._redis = r
+        self._pending = []
+        self._scheduled = False
+        # The loop only keeps weak references to tasks
+        self._tasks = set()
+        self._round_trips = 0
+
+    @property
+    def round_trips(self):
+        """
+        Number of pipelines sent to Redis
+        :return int:
+        """
+        return self._round_trips
+
+    async def execute(self, commands):
+        """
+        Queues commands for the next pipeline and waits for their results
+        :param list of tuple commands: List of (command name, *args)
+        :return list: Result of each command
+        """
+        if not commands:
+            return []
+        future = get_running_loop().create_future()
+        self._pending.append((commands, future))
+        if not self._scheduled:
+            self._scheduled = True
+            # Runs after every task that is ready in this iteration
+            get_running_loop().call_soon(self._flush)
+        return await future
+
+    def _flush(self):
+        if not self._scheduled:
+            # Already sent by close()
+            return
+        self._scheduled = False
+        batch, self._pending = self._pending, []
+        task = ensure_future(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._on_sent)
+
+    def _on_sent(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            log('Pipeline failed: {}'.format(task.exception()))
+
+    async def close(self):
+        """
+        Sends the queued commands right away and waits for all
+        pipelines still in flight
+        """
+        self._flush()
+        if self._tasks:
+            await gather(*self._tasks, return_exceptions=True)
+
+    async def _send(self, batch):
+        # Without MULTI/EXEC a failing command does not abort the others
+        pipe = self._redis.pipeline(transaction=False)
+        encoder = self._redis.get_encoder()
+        queued = []
+        for commands, future in batch:
+            start = len(pipe.command_stack)
+            try:
+                for name, *args in commands:
+                    getattr(pipe, name)(*args)
+                # Invalid arguments would only fail once the whole
+                # pipeline gets packed, taking every request down with it
+                for args, _ in pipe.command_stack[start:]:
+                    for arg in args:
+                        encoder.encode(arg)
+            except Exception as e:
+                del pipe.command_stack[start:]
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            queued.append((len(pipe.command_stack) - start, future))
+        if not queued:
+            return
+
+        try:
+            results = await pipe.execute(raise_on_error=False)
+            self._round_trips += 1
+        except Exception as e:
+            for _, future in queued:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for count, future in queued:
+            part = results[offset:offset + count]
+            offset += count
+            if future.done():
+                # The request has been cancelled
+                continue
+            error = next((item for item in part if isinstance(item, Exception)), None)
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result(part)
+
+
+def get_batcher(r):
+    """
+    Returns the batcher shared by all clients of the same connection pool
+    on the running event loop
+    :param Redis r: asyncio Redis instance
+    :return PipelineBatcher:
+    """
+    batchers = _BATCHERS.setdefault(get_running_loop(), {})
+    batcher = batchers.get(r.connection_pool)
+    if not batcher:
+        batcher = PipelineBatcher(r)
+        batchers[r.connection_pool] = batcher
+    return batcher
+
+
+async def _execute(r, commands):
+    return await get_batcher(r).execute(commands)
+
+
+async def get_piped(r, keys):
+    """
+    Requests all listed items at once.
+    Returns a dictionary with the key-value pairs being equivalent
+    to the stored values in Redis.
+    :param Redis r:
+    :param list of str keys:
+    :return dict of (str, str):
+    """
+    data = await _execute(r, [('get', key) for key in keys])
+    return dict(zip(keys, data))
+
+
+async def set_piped(r, data_dict, expire=None):
+    """
+    Sends all listed items at once.
+    Returns a dictionary with the key-value pairs containing the
+    result of each operation.
+    :param Redis r:
+    :param dict of (str, object) data_dict: Values to set, None deletes the key
+    :param int expire: Seconds until the values expire (default: RCONFIG_VALUE_EXPIRE)
+    :return dict of (str, str):
+    """
+    expire = _redis.RCONFIG_VALUE_EXPIRE if expire is None else expire
+    keys = list(data_dict)
+    data = await _execute(r, [('delete', key) if value is None
+                              else ('set', key, value, expire)
+                              for key, value in data_dict.items()])
+    return dict(zip(keys, data))
+
+
+async def incr_piped(r, data_dict, expire=None):
+    """
+    Same as set_piped, but uses INCRBYFLOAT instead of SET.
+    Increases <key> by <value>; the expiration is only (re)set if expire is given.
+    :param Redis r:
+    :param dict of (str, object) data_dict: Increments, None deletes the key
+    :param int expire: Seconds until the values expire
+    :return dict of (str, str): New value of each key
+    """
+    commands = []
+    indices = {}
+    for key, value in data_dict.items():
+        indices[key] = len(commands)
+        if value is None:
+            commands.append(('delete', key))
+        else:
+            commands.append(('incrbyfloat', key, value))
+            if expire:
+                commands.append(('expire', key, expire))
+    data = await _execute(r, commands)
+    return {key: data[i] for key, i in indices.items()}
+
+
+async def send_command_request(r, command, params=None):
+    """
+    Creates a new Command Request and sends it to Redis for
+    a request processor to process
+    :param Redis r: Redis instance
+    :param str command: Command Name
+    :param dict of str, object params: Optional Command params
+    """
+    commands = [('set', command, str(True), RCONFIG_VALUE_EXPIRE_COMMANDS)]
+    for key, value in (params or {}).items():
+        if value is not None:
+            commands.append(('set', get_command_param_key(command, key), value, RCONFIG_VALUE_EXPIRE_COMMANDS))
+    await _execute(r, commands)
+
+
+async def set_command_as_handled(r, command):
+    """
+    Removes a Command Request from Redis and thus marks it as handled
+    :param Redis r: Redis instance
+    :param str command: Command Name
+    """
+    await _execute(r, [('delete', command)])
+
+
+async def get_command_params(r, command, params, delete_after_request=True):
+    """
+    Returns one or more parameters of a given command
+    :param Redis r: Redis instance
+    :param str command: Command Name
+    :param str|list of str params: Parameter Name or list of Parameter Names to request
+    :param bool delete_after_request: If True, all requested parameters will be deleted after execution
+    :return str|dict of str, str:
+    """
+    if not isinstance(params, list):
+        return (await _execute(r, [('get', get_command_param_key(command, params))]))[0]
+
+    keys = [get_command_param_key(command, param) for param in params]
+    commands = [('get', key) for key in keys]
+    if delete_after_request:
+        # Read and deleted within the same pipeline
+        commands += [('delete', key) for key in keys]
+    data = await _execute(r, commands)
+    return dict(zip(params, data))
+
+
+async def load_synced_value(r, pr, key):
+    """
+    :param Redis r: Redis instance
+    :param Redis pr: Persistent Redis instance
+    :param str key:
+    :return str:
+    """
+    o = await get_piped(pr, [key])
+    if o.get(key):
+        await set_piped(r, {key: o[key]})
+        return o[key]
+    await _execute(r, [('delete', key)])
+    return None
+
+
+async def save_synced_value(r, pr, key, value):
+    """
+    :param Redis r: Redis instance
+    :param Redis pr: Persistent Redis instance
+    :param str key:
+    :param str|None value:
+    """
+    s = {key: value or None}
+    # Both instances are written concurrently
+    await gather(set_piped(r, s), set_piped(pr, s))
+
+
+async def check_command_requests(r, commands):
+    """
+    Checks a list of commands for a pending request
+    :param Redis r: Redis instance
+    :param list of str commands: List of Commands
+    :return:
+    """
+    return await get_piped(r, commands)
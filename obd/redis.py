@@ -1,6 +1,11 @@
-from configparser import NoOptionError
+from configparser import NoOptionError, NoSectionError
+from threading import Event, Lock
+from time import monotonic
 
-from redis import Redis
+from redis import Redis, ConnectionPool
+from redis.exceptions import ResponseError
+
+from obd import ObdRedisKeys
 
 # Config Sections and Keys
 RCONFIG_SECTION = 'Redis'
@@ -9,9 +14,38 @@ RCONFIG_KEY_HOST = 'host'
 RCONFIG_KEY_PORT = 'port'
 RCONFIG_KEY_DB = 'db'
 RCONFIG_KEY_EXPIRE = 'expire'
+RCONFIG_KEY_SNAPSHOT_TTL = 'snapshot_ttl'
+RCONFIG_KEY_NOTIFICATIONS = 'notifications'
+RCONFIG_KEY_LAYOUT = 'layout'
 
 RCONFIG_VALUE_EXPIRE = None
 RCONFIG_VALUE_EXPIRE_COMMANDS = 5
+# Seconds a value read through a SnapshotCache is considered fresh
+RCONFIG_VALUE_SNAPSHOT_TTL = 0.05
+
+# Storage layouts of the OBD values (RCONFIG_KEY_LAYOUT)
+LAYOUT_KEYS = 'keys'
+# One hash (ObdRedisKeys.KEY_SNAPSHOT) holding all values
+LAYOUT_HASH = 'hash'
+# Hash, plus every value mirrored into its own key for readers of the old layout
+LAYOUT_HASH_MIRRORED = 'hash+keys'
+RCONFIG_VALUE_LAYOUT = LAYOUT_KEYS
+
+# Ways of learning about changed values (RCONFIG_KEY_NOTIFICATIONS)
+NOTIFY_OFF = 'off'
+NOTIFY_KEYSPACE = 'keyspace'
+NOTIFY_CHANNEL = 'channel'
+NOTIFY_CONFIG_KEY = 'notify-keyspace-events'
+# Seconds a subscriber waits for a message before looking for newly watched keys
+SUBSCRIBE_TIMEOUT = 0.1
+# Seconds between two reads of all subscribed keys, covering lost messages
+SUBSCRIBE_RESYNC_INTERVAL = 30
+
+# One connection pool per config section, shared by all clients
+_POOLS = {}
+_POOLS_LOCK = Lock()
+# One snapshot cache per connection pool
+_SNAPSHOT_CACHES = {}
 
 
 def log(s):
@@ -19,23 +53,47 @@ def log(s):
     pass
 
 
+def get_connection_kwargs(config, section):
+    """
+    Returns the connection settings of a config section
+    :param ConfigParser config:
+    :param str section:
+    :return dict:
+    """
+    return dict(host=config.get(section, RCONFIG_KEY_HOST),
+                port=config.getint(section, RCONFIG_KEY_PORT),
+                db=config.get(section, RCONFIG_KEY_DB),
+                socket_connect_timeout=5)
+
+
+def _get_pool(config, section):
+    """
+    Returns the process-wide connection pool of a config section
+    :param ConfigParser config:
+    :param str section:
+    :return ConnectionPool:
+    """
+    with _POOLS_LOCK:
+        pool = _POOLS.get(section)
+        if not pool:
+            pool = ConnectionPool(**get_connection_kwargs(config, section))
+            _POOLS[section] = pool
+        return pool
+
+
 def _get_redis(config, section):
     """
     :param ConfigParser config:
     :param str section:
     :return Redis:
     """
-    return Redis(host=config.get(section, RCONFIG_KEY_HOST),
-                 port=config.getint(section, RCONFIG_KEY_PORT),
-                 db=config.get(section, RCONFIG_KEY_DB),
-                 socket_connect_timeout=5)
+    return Redis(connection_pool=_get_pool(config, section))
 
 
-def get_redis(config):
+def load_config(config):
     """
-    Returns the default Redis connection
+    Applies the expiration and caching options of the default section
     :param ConfigParser config:
-    :return Redis:
     """
     global RCONFIG_VALUE_EXPIRE
     try:
@@ -48,6 +106,29 @@ def get_redis(config):
         log("The provided default Expire value is invalid! No expiration will be set.")
         RCONFIG_VALUE_EXPIRE = None
 
+    global RCONFIG_VALUE_SNAPSHOT_TTL
+    try:
+        RCONFIG_VALUE_SNAPSHOT_TTL = config.getfloat(RCONFIG_SECTION, RCONFIG_KEY_SNAPSHOT_TTL)
+    except (NoOptionError, NoSectionError, ValueError):
+        pass
+
+    global RCONFIG_VALUE_LAYOUT
+    try:
+        RCONFIG_VALUE_LAYOUT = config.get(RCONFIG_SECTION, RCONFIG_KEY_LAYOUT).strip().lower()
+    except (NoOptionError, NoSectionError):
+        RCONFIG_VALUE_LAYOUT = LAYOUT_KEYS
+    if RCONFIG_VALUE_LAYOUT not in (LAYOUT_KEYS, LAYOUT_HASH, LAYOUT_HASH_MIRRORED):
+        log("Unknown storage layout {}, values are stored per key.".format(RCONFIG_VALUE_LAYOUT))
+        RCONFIG_VALUE_LAYOUT = LAYOUT_KEYS
+
+
+def get_redis(config):
+    """
+    Returns the default Redis connection
+    :param ConfigParser config:
+    :return Redis:
+    """
+    load_config(config)
     return _get_redis(config, RCONFIG_SECTION)
 
 
@@ -82,61 +163,519 @@ def get_piped(r, keys):
     return data_dict
 
 
-def set_piped(r, data_dict):
+class SnapshotCache(object):
+    """
+    Read-through cache in front of get_values. Values younger than the TTL
+    are served from memory; a miss fetches the requested keys together
+    with every other stale key read since its last fetch, so overlapping
+    reads of several screens (or several reads within one frame) share a
+    single round trip. Thread-safe: the fetch runs outside the lock, so
+    hits are never held up by it, and misses on keys already being
+    fetched wait for that fetch instead of issuing their own.
+    """
+
+    def __init__(self, r, ttl=None):
+        """
+        :param Redis r: Redis instance
+        :param float ttl: Seconds a value stays fresh (default: RCONFIG_VALUE_SNAPSHOT_TTL)
+        """
+        self._redis = r
+        self._ttl = ttl
+        self._values = {}
+        self._timestamps = {}
+        # Keys read since their last fetch, taken along by the next miss
+        self._wanted = set()
+        # Key -> Event of the fetch currently reading it
+        self._fetching = {}
+        self._lock = Lock()
+        self._round_trips = 0
+
+    @property
+    def ttl(self):
+        return RCONFIG_VALUE_SNAPSHOT_TTL if self._ttl is None else self._ttl
+
+    @property
+    def round_trips(self):
+        """
+        Number of pipelines sent to Redis
+        :return int:
+        """
+        return self._round_trips
+
+    def get(self, keys):
+        """
+        Returns the values of the given keys, at most TTL seconds old
+        :param list of str keys:
+        :return dict of (str, bytes):
+        """
+        fetched = False
+        while True:
+            with self._lock:
+                now = monotonic()
+                ttl = self.ttl
+                timestamps = self._timestamps
+                if fetched:
+                    # Values fetched (or waited for) in this call are used
+                    # even if they are already older than the TTL
+                    missing = [key for key in keys if key not in timestamps]
+                else:
+                    missing = [key for key in keys if now - timestamps.get(key, -ttl - 1) > ttl]
+                if not missing:
+                    self._wanted.update(keys)
+                    return {key: self._values[key] for key in keys}
+
+                fetching = self._fetching
+                running = {fetching[key] for key in missing if key in fetching}
+                fetch = [key for key in missing if key not in fetching]
+                if fetch:
+                    fetch += [key for key in self._wanted
+                              if key not in fetching and key not in fetch
+                              and now - timestamps.get(key, -ttl - 1) > ttl]
+                    done = Event()
+                    for key in fetch:
+                        fetching[key] = done
+
+            if fetch:
+                self._fetch(fetch, done)
+            for event in running:
+                event.wait()
+            fetched = True
+
+    def _fetch(self, keys, done):
+        started = monotonic()
+        try:
+            values = get_values(self._redis, keys)
+        except Exception:
+            with self._lock:
+                for key in keys:
+                    self._fetching.pop(key, None)
+            done.set()
+            raise
+        with self._lock:
+            self._values.update(values)
+            self._round_trips += 1
+            for key in keys:
+                self._timestamps[key] = started
+                self._fetching.pop(key, None)
+            self._wanted.difference_update(keys)
+        done.set()
+
+    def invalidate(self, keys=None):
+        """
+        Marks values as stale, e.g. after writing them
+        :param list of str keys: Keys to invalidate, None for all
+        """
+        with self._lock:
+            for key in (list(self._timestamps) if keys is None else keys):
+                self._timestamps.pop(key, None)
+
+
+def get_snapshot_cache(r):
+    """
+    Returns the snapshot cache shared by all clients of the same connection pool
+    :param Redis r: Redis instance
+    :return SnapshotCache:
+    """
+    with _POOLS_LOCK:
+        cache = _SNAPSHOT_CACHES.get(r.connection_pool)
+        if not cache:
+            cache = SnapshotCache(r)
+            _SNAPSHOT_CACHES[r.connection_pool] = cache
+        return cache
+
+
+def get_cached(r, keys):
+    """
+    Same as get_values, but reads through the shared snapshot cache
+    :param Redis r: Redis instance
+    :param list of str keys:
+    :return dict of (str, bytes):
+    """
+    return get_snapshot_cache(r).get(keys)
+
+
+def get_notification_mode(config):
+    """
+    Returns how the UI should learn about changed values
+    :param ConfigParser config:
+    :return str: NOTIFY_KEYSPACE, NOTIFY_CHANNEL or NOTIFY_OFF (polling)
+    """
+    try:
+        mode = config.get(RCONFIG_SECTION, RCONFIG_KEY_NOTIFICATIONS).strip().lower()
+    except (NoOptionError, NoSectionError):
+        return NOTIFY_OFF
+    if mode not in (NOTIFY_KEYSPACE, NOTIFY_CHANNEL):
+        log("Unknown notification mode {}, values will be polled.".format(mode))
+        return NOTIFY_OFF
+    return mode
+
+
+def keyspace_notifications_enabled(r, layout=None):
+    """
+    Checks whether the server publishes the keyspace notifications of the
+    commands writing the values: notify-keyspace-events has to contain K
+    and either A or the class of the layout ($ for strings, h for hashes).
+    Servers not allowing CONFIG GET are treated as disabled.
+    :param Redis r:
+    :param str layout: LAYOUT_* (default: RCONFIG_VALUE_LAYOUT)
+    :return bool:
+    """
+    layout = RCONFIG_VALUE_LAYOUT if layout is None else layout
+    event_class = '$' if layout == LAYOUT_KEYS else 'h'
+    try:
+        flags = r.config_get(NOTIFY_CONFIG_KEY).get(NOTIFY_CONFIG_KEY, '')
+    except ResponseError:
+        return False
+    if isinstance(flags, bytes):
+        flags = flags.decode('utf-8')
+    return 'K' in flags and ('A' in flags or event_class in flags)
+
+
+def publish_updates(r, keys, channel=ObdRedisKeys.CHANNEL_UPDATES):
+    """
+    Announces changed keys to subscribers in NOTIFY_CHANNEL mode,
+    to be called by the producer after writing the values
+    :param Redis r:
+    :param list of str keys:
+    :param str channel:
+    :return int: Number of subscribers that received the message
+    """
+    return r.publish(channel, ' '.join(keys))
+
+
+class ValueSubscriber(object):
+    """
+    Keeps a local table of values up to date by listening for changes
+    instead of polling every key: either to the keyspace notifications
+    of the key pattern (NOTIFY_KEYSPACE) or to a channel the producer
+    publishes the names of changed keys on (NOTIFY_CHANNEL). Only the
+    keys announced as changed get read, all of a batch of messages in
+    one pipeline. Every watched key is read again once subscribed and
+    after every resync interval, covering messages lost in between.
+    """
+
+    def __init__(self, r, mode=NOTIFY_KEYSPACE,
+                 pattern=ObdRedisKeys.KEY_PATTERN,
+                 channel=ObdRedisKeys.CHANNEL_UPDATES,
+                 timeout=SUBSCRIBE_TIMEOUT,
+                 resync_interval=SUBSCRIBE_RESYNC_INTERVAL):
+        """
+        :param Redis r: Redis instance
+        :param str mode: NOTIFY_KEYSPACE or NOTIFY_CHANNEL
+        :param str pattern: Keys to listen for (NOTIFY_KEYSPACE)
+        :param str channel: Channel to listen on (NOTIFY_CHANNEL)
+        :param float timeout: Seconds to wait for a message before checking
+                              for newly watched keys and the stop event
+        :param float resync_interval: Seconds between two reads of all watched keys
+        """
+        self._redis = r
+        self._mode = mode
+        self._pattern = pattern
+        self._channel = channel
+        self._timeout = timeout
+        self._resync_interval = resync_interval
+        self._keys = frozenset()
+        self._pending = set()
+        self._lock = Lock()
+        self._values = {}
+        self._round_trips = 0
+
+    @property
+    def mode(self):
+        return self._mode
+
+    @property
+    def values(self):
+        """
+        Current values, replaced (never modified) on every change
+        :return dict of (str, bytes):
+        """
+        return self._values
+
+    @property
+    def round_trips(self):
+        """
+        Number of pipelines sent to Redis
+        :return int:
+        """
+        return self._round_trips
+
+    def watch(self, keys):
+        """
+        Adds keys to the table, they get read within the next timeout
+        :param list of str keys:
+        """
+        with self._lock:
+            new_keys = [key for key in keys if key not in self._keys]
+            self._keys = self._keys.union(new_keys)
+            self._pending.update(new_keys)
+
+    def _get_subscription(self):
+        if self._mode == NOTIFY_KEYSPACE:
+            db = self._redis.connection_pool.connection_kwargs.get('db', 0)
+            return '__keyspace@{}__:{}'.format(db, self._pattern)
+        return self._channel
+
+    def _get_keys(self, message):
+        """
+        :return list of str: Keys a message announces as changed
+        """
+        if message['type'] == 'pmessage':
+            # __keyspace@<db>__:<key>, the data is the name of the command
+            return [message['channel'].decode('utf-8').split(':', 1)[1]]
+        if message['type'] == 'message':
+            return message['data'].decode('utf-8').split()
+        return []
+
+    def _fetch(self, keys):
+        """
+        Reads the given keys and replaces the table if any value has changed
+        :return bool: True if the table has changed
+        """
+        data = get_values(self._redis, keys)
+        self._round_trips += 1
+        values = self._values
+        if all(key in values and values[key] == value for key, value in data.items()):
+            return False
+        values = dict(values)
+        values.update(data)
+        self._values = values
+        return True
+
+    def run(self, stop_event, on_change=None):
+        """
+        Listens for changes until the stop event gets set. Errors (e.g. a
+        lost connection) are raised, the table is kept and may be resumed
+        by calling run() again.
+        :param threading.Event stop_event: Ends the subscription
+        :param on_change: Called with the new table after every change
+        :return bool: False if keyspace notifications are disabled on the
+                      server, so the values have to be polled instead
+        """
+        # The values are read (and written) in the configured layout,
+        # so its events have to be enabled
+        if self._mode == NOTIFY_KEYSPACE \
+                and not keyspace_notifications_enabled(self._redis, RCONFIG_VALUE_LAYOUT):
+            return False
+
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            if self._mode == NOTIFY_KEYSPACE:
+                pubsub.psubscribe(self._get_subscription())
+            else:
+                pubsub.subscribe(self._get_subscription())
+            # Changes made until the subscription has been set up are
+            # only caught by reading everything once more
+            resync_at = monotonic()
+
+            while not stop_event.is_set():
+                changed = set()
+                message = pubsub.get_message(timeout=self._timeout)
+                while message:
+                    changed.update(self._get_keys(message))
+                    message = pubsub.get_message()
+
+                with self._lock:
+                    keys = self._keys
+                    changed.update(self._pending)
+                    self._pending.clear()
+                if monotonic() >= resync_at or ObdRedisKeys.KEY_SNAPSHOT in changed:
+                    # A write to the hash layout may change any of the keys
+                    changed = keys
+                    resync_at = monotonic() + self._resync_interval
+
+                changed = [key for key in changed if key in keys]
+                if changed and self._fetch(changed) and on_change:
+                    on_change(self._values)
+        finally:
+            pubsub.close()
+        return True
+
+
+def set_piped(r, data_dict, expire=None):
     """
     Creates a Pipeline and sends all listed items at once.
     Returns a dictionary with the key-value pairs containing the
     result of each operation.
     :param Redis r:
-    :param dict of (str, object) data_dict:
+    :param dict of (str, object) data_dict: Values to set, None deletes the key
+    :param int expire: Seconds until the values expire (default: RCONFIG_VALUE_EXPIRE)
     :return dict of (str, str):
     """
+    expire = RCONFIG_VALUE_EXPIRE if expire is None else expire
     keys = []
-    result_dict = {}
     pipe = r.pipeline()
-    for key, value in data_dict.iteritems():
+    for key, value in data_dict.items():
         if value is None:
             pipe.delete(key)
         else:
-            pipe.set(key, value, ex=RCONFIG_VALUE_EXPIRE)
-
-        result_dict[key] = None
+            pipe.set(key, value, ex=expire)
         keys.append(key)
 
-    data = pipe.execute()
-    for i, item in enumerate(data):
-        result_dict[keys[i]] = item
-
-    return result_dict
+    return dict(zip(keys, pipe.execute()))
 
 
-def incr_piped(r, data_dict):
+def incr_piped(r, data_dict, expire=None):
     """
-    Same as set_piped, but uses INCRBY instead of SET.
-    Increases <key> by <value>.
-    Note that INCRBY does not support expiration so this will
-    not be taken into account
+    Same as set_piped, but uses INCRBYFLOAT instead of SET.
+    Increases <key> by <value>. INCRBYFLOAT keeps the expiration of
+    the key, so it is only (re)set if expire is given.
     :param Redis r:
-    :param dict of (str, object) data_dict:
-    :return dict of (str, str):
+    :param dict of (str, object) data_dict: Increments, None deletes the key
+    :param int expire: Seconds until the values expire
+    :return dict of (str, str): New value of each key
     """
-    keys = []
-    result_dict = {}
+    # Index of each key's result, skipping those of EXPIRE
+    indices = {}
     pipe = r.pipeline()
-    for key, value in data_dict.iteritems():
+    for key, value in data_dict.items():
+        indices[key] = len(pipe)
         if value is None:
             pipe.delete(key)
         else:
             pipe.incrbyfloat(key, value)
+            if expire:
+                pipe.expire(key, expire)
 
-        result_dict[key] = None
-        keys.append(key)
+    data = pipe.execute()
+    return {key: data[i] for key, i in indices.items()}
+
+
+def get_snapshot(r, hash_key=ObdRedisKeys.KEY_SNAPSHOT):
+    """
+    Reads all values of the hash layout with a single HGETALL
+    :param Redis r:
+    :param str hash_key:
+    :return tuple of (int, dict of (str, bytes)): Generation (0 if nothing
+                                                   has been written yet) and values
+    """
+    data = r.hgetall(hash_key)
+    generation = int(data.pop(ObdRedisKeys.KEY_GENERATION.encode('utf-8'), 0))
+    return generation, {field.decode('utf-8'): value for field, value in data.items()}
+
+
+def get_hashed(r, keys, hash_key=ObdRedisKeys.KEY_SNAPSHOT):
+    """
+    Same as get_piped, but reads the hash layout
+    :param Redis r:
+    :param list of str keys:
+    :param str hash_key:
+    :return dict of (str, str):
+    """
+    _, values = get_snapshot(r, hash_key)
+    return {key: values.get(key) for key in keys}
+
+
+def _write_hashed(r, data_dict, command, expire, hash_key, mirror_keys):
+    """
+    Writes all values in one transaction and increments the generation
+    :return tuple of (int, dict of (str, int)): Generation and the index
+                                                of each key's result
+    """
+    pipe = r.pipeline()
+    indices = {}
+    deleted = [key for key, value in data_dict.items() if value is None]
+    if deleted:
+        pipe.hdel(hash_key, *deleted)
+    if command == 'hset':
+        mapping = {key: value for key, value in data_dict.items() if value is not None}
+        if mapping:
+            indices = dict.fromkeys(mapping, len(pipe))
+            pipe.hset(hash_key, mapping=mapping)
+    else:
+        for key, value in data_dict.items():
+            if value is not None:
+                indices[key] = len(pipe)
+                pipe.hincrbyfloat(hash_key, key, value)
+    generation = len(pipe)
+    pipe.hincrby(hash_key, ObdRedisKeys.KEY_GENERATION, 1)
+    if expire:
+        pipe.expire(hash_key, expire)
+
+    if mirror_keys:
+        for key, value in data_dict.items():
+            if value is None:
+                pipe.delete(key)
+            elif command == 'hset':
+                pipe.set(key, value, ex=expire)
+            else:
+                pipe.incrbyfloat(key, value)
+                if expire:
+                    pipe.expire(key, expire)
 
     data = pipe.execute()
-    for i, item in enumerate(data):
-        result_dict[keys[i]] = item
+    return data[generation], {key: data[i] for key, i in indices.items()}
+
+
+def set_hashed(r, data_dict, expire=None, hash_key=ObdRedisKeys.KEY_SNAPSHOT, mirror_keys=False):
+    """
+    Writes all values as one new generation of the hash layout. The
+    values are written in a transaction, so readers never see a partial
+    update. Expiration applies to the whole hash: it only expires once
+    nothing has been written for the given time.
+    :param Redis r:
+    :param dict of (str, object) data_dict: Values to set, None deletes the value
+    :param int expire: Seconds until the values expire (default: RCONFIG_VALUE_EXPIRE)
+    :param str hash_key:
+    :param bool mirror_keys: Also write every value to its own key, for readers of the old layout
+    :return int: Generation written
+    """
+    expire = RCONFIG_VALUE_EXPIRE if expire is None else expire
+    generation, _ = _write_hashed(r, data_dict, 'hset', expire, hash_key, mirror_keys)
+    return generation
+
 
-    return result_dict
+def incr_hashed(r, data_dict, expire=None, hash_key=ObdRedisKeys.KEY_SNAPSHOT, mirror_keys=False):
+    """
+    Same as set_hashed, but uses HINCRBYFLOAT instead of HSET.
+    The expiration is only (re)set if expire is given.
+    :param Redis r:
+    :param dict of (str, object) data_dict: Increments, None deletes the value
+    :param int expire: Seconds until the values expire
+    :param str hash_key:
+    :param bool mirror_keys: Also increment every value in its own key
+    :return dict of (str, str): New value of each incremented key
+    """
+    _, values = _write_hashed(r, data_dict, 'hincrbyfloat', expire, hash_key, mirror_keys)
+    return values
+
+
+def get_values(r, keys):
+    """
+    Reads OBD values from the configured storage layout (RCONFIG_VALUE_LAYOUT)
+    :param Redis r:
+    :param list of str keys:
+    :return dict of (str, str):
+    """
+    if RCONFIG_VALUE_LAYOUT == LAYOUT_KEYS:
+        return get_piped(r, keys)
+    return get_hashed(r, keys)
+
+
+def set_values(r, data_dict, expire=None):
+    """
+    Writes OBD values in the configured storage layout (RCONFIG_VALUE_LAYOUT)
+    :param Redis r:
+    :param dict of (str, object) data_dict: Values to set, None deletes the value
+    :param int expire: Seconds until the values expire (default: RCONFIG_VALUE_EXPIRE)
+    """
+    if RCONFIG_VALUE_LAYOUT == LAYOUT_KEYS:
+        set_piped(r, data_dict, expire)
+    else:
+        set_hashed(r, data_dict, expire, mirror_keys=RCONFIG_VALUE_LAYOUT == LAYOUT_HASH_MIRRORED)
+
+
+def incr_values(r, data_dict, expire=None):
+    """
+    Increments OBD values in the configured storage layout (RCONFIG_VALUE_LAYOUT)
+    :param Redis r:
+    :param dict of (str, object) data_dict: Increments, None deletes the value
+    :param int expire: Seconds until the values expire
+    :return dict of (str, str): New value of each incremented key
+    """
+    if RCONFIG_VALUE_LAYOUT == LAYOUT_KEYS:
+        return incr_piped(r, data_dict, expire)
+    return incr_hashed(r, data_dict, expire, mirror_keys=RCONFIG_VALUE_LAYOUT == LAYOUT_HASH_MIRRORED)
 
 
 def get_command_param_key(command, param_name):
@@ -153,9 +692,9 @@ def send_command_request(r, command, params=None):
     :return:
     """
     pipe = r.pipeline()
-    pipe.set(command, True, ex=RCONFIG_VALUE_EXPIRE_COMMANDS)
+    pipe.set(command, str(True), ex=RCONFIG_VALUE_EXPIRE_COMMANDS)
     if params:
-        for key, value in params.iteritems():
+        for key, value in params.items():
             if value is not None:
                 param_key = get_command_param_key(command, key)
                 pipe.set(param_key, value, ex=RCONFIG_VALUE_EXPIRE_COMMANDS)
@@ -196,13 +735,13 @@ def get_command_params(r, command, params, delete_after_request=True):
 
         out = get_piped(r, keys)
 
-        for key, value in out.iteritems():
+        for key, value in out.items():
             output[key_map[key]] = value
 
         if delete_after_request:
             pipe = r.pipeline()
             for key in keys:
-                r.delete(key)
+                pipe.delete(key)
             pipe.execute()
 
         return output
@@ -0,0 +1,135 @@
+from obd import ObdRedisKeys
+from utils import try_int
+
+TYPE_INT = 'int'
+TYPE_FLOAT = 'float'
+TYPE_BOOL = 'bool'
+TYPE_STR = 'str'
+
+
+def _parse_float(raw):
+    try:
+        return float(raw)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_bool(raw):
+    # Booleans are stored as str(True) / str(False)
+    return None if raw is None else raw == b'True'
+
+
+def _parse_str(raw):
+    return None if raw is None else raw.decode('utf-8')
+
+
+_PARSERS = {
+    TYPE_INT: try_int,
+    TYPE_FLOAT: _parse_float,
+    TYPE_BOOL: _parse_bool,
+    TYPE_STR: _parse_str
+}
+
+
+class KeySpec(object):
+    """
+    Type and unit of a Redis key, and the attribute of TelemetryValues it is decoded into
+    """
+    __slots__ = ('key', 'attr', 'type', 'unit', 'parse')
+
+    def __init__(self, key, attr, value_type, unit=None):
+        """
+        :param str key: Redis key
+        :param str attr: Attribute of TelemetryValues
+        :param str value_type: TYPE_*
+        :param str unit: Unit of the value, None if it has none
+        """
+        self.key = key
+        self.attr = attr
+        self.type = value_type
+        self.unit = unit
+        self.parse = _PARSERS[value_type]
+
+
+OBD_SCHEMA = {spec.key: spec for spec in [
+    KeySpec(ObdRedisKeys.KEY_ALIVE, 'state', TYPE_INT),
+    KeySpec(ObdRedisKeys.KEY_BATTERY_VOLTAGE, 'battery_voltage', TYPE_FLOAT, 'V'),
+    KeySpec(ObdRedisKeys.KEY_ENGINE_LOAD, 'engine_load', TYPE_FLOAT, '%'),
+    KeySpec(ObdRedisKeys.KEY_COOLANT_TEMP, 'coolant_temp', TYPE_INT, '°C'),
+    KeySpec(ObdRedisKeys.KEY_INTAKE_MAP, 'intake_map', TYPE_INT, 'kPa'),
+    KeySpec(ObdRedisKeys.KEY_ENGINE_RPM, 'rpm', TYPE_INT, 'rpm'),
+    KeySpec(ObdRedisKeys.KEY_VEHICLE_SPEED, 'speed', TYPE_INT, 'km/h'),
+    KeySpec(ObdRedisKeys.KEY_INTAKE_TEMP, 'intake_temp', TYPE_INT, '°C'),
+    KeySpec(ObdRedisKeys.KEY_O2_SENSOR_FAEQV, 'o2_fuel_air_ratio', TYPE_FLOAT),
+    KeySpec(ObdRedisKeys.KEY_O2_SENSOR_CURRENT, 'o2_current', TYPE_FLOAT, 'mA'),
+    KeySpec(ObdRedisKeys.KEY_FUELSYS_1_STATUS, 'fuel_system_1_status', TYPE_INT),
+    KeySpec(ObdRedisKeys.KEY_FUELSYS_2_STATUS, 'fuel_system_2_status', TYPE_INT),
+    KeySpec(ObdRedisKeys.KEY_MIL_STATUS, 'mil', TYPE_BOOL),
+    KeySpec(ObdRedisKeys.KEY_DTC_COUNT, 'dtc_count', TYPE_INT),
+    KeySpec(ObdRedisKeys.KEY_CURRENT_DTCS, 'current_dtcs', TYPE_STR),
+    KeySpec(ObdRedisKeys.KEY_PENDING_DTCS, 'pending_dtcs', TYPE_STR)
+]}
+
+
+class TelemetryValues(object):
+    """
+    Decoded values of all keys of OBD_SCHEMA, None for keys that are
+    missing or not watched. Shared between readers, so it must be
+    treated as read-only.
+    """
+    __slots__ = tuple(spec.attr for spec in OBD_SCHEMA.values())
+
+    def __init__(self):
+        for attr in TelemetryValues.__slots__:
+            setattr(self, attr, None)
+
+
+class SnapshotDecoder(object):
+    """
+    Turns the raw reply of a pipeline/MGET into TelemetryValues in a
+    single pass. Values whose raw bytes did not change since the
+    previous reply are taken over instead of being parsed again; if
+    nothing changed at all, the previous TelemetryValues is returned.
+    """
+
+    def __init__(self, schema=None):
+        """
+        :param dict of (str, KeySpec) schema: Keys to decode (default: OBD_SCHEMA)
+        """
+        self._schema = OBD_SCHEMA if schema is None else schema
+        self._raw = {}
+        self._values = TelemetryValues()
+        self._parsed = 0
+
+    @property
+    def parsed(self):
+        """
+        Number of values parsed so far
+        :return int:
+        """
+        return self._parsed
+
+    def decode(self, data):
+        """
+        :param dict of (str, bytes) data: Raw values as returned by get_piped
+        :return TelemetryValues:
+        """
+        previous = self._values
+        raw = self._raw
+        values = None
+        for key, spec in self._schema.items():
+            value = data.get(key)
+            if key in raw and raw[key] == value:
+                continue
+            if values is None:
+                values = TelemetryValues()
+                for attr in TelemetryValues.__slots__:
+                    setattr(values, attr, getattr(previous, attr))
+            raw[key] = value
+            setattr(values, spec.attr, spec.parse(value))
+            self._parsed += 1
+
+        if values is None:
+            return previous
+        self._values = values
+        return values
@@ -0,0 +1,192 @@
+from threading import Thread, Event, Lock
+from time import monotonic
+from types import MappingProxyType
+
+from obd.redis import get_snapshot_cache, NOTIFY_OFF, ValueSubscriber
+from obd.schema import SnapshotDecoder
+
+TELEMETRY_INTERVAL = 0.1
+
+
+def log(s):
+    # dummy method
+    pass
+
+
+class TelemetrySnapshot(object):
+    """
+    Immutable set of values read from Redis in one round trip.
+    A failed read results in a snapshot without any values.
+    """
+    __slots__ = ('_values', '_decoded', '_timestamp', '_error')
+
+    def __init__(self, values=None, timestamp=None, error=None, decoded=None):
+        """
+        :param dict of (str, bytes) values: Raw values as returned by Redis
+        :param float timestamp: time.monotonic() of the read
+        :param Exception error: Error raised by the read, if any
+        :param TelemetryValues decoded: Parsed values
+        """
+        self._values = MappingProxyType(dict(values or {}))
+        self._decoded = decoded
+        self._timestamp = monotonic() if timestamp is None else timestamp
+        self._error = error
+
+    @property
+    def values(self):
+        return self._values
+
+    @property
+    def decoded(self):
+        """
+        Parsed values, None before the first read or if the read failed
+        :return TelemetryValues:
+        """
+        return self._decoded
+
+    @property
+    def timestamp(self):
+        return self._timestamp
+
+    @property
+    def age(self):
+        """
+        Seconds since the values have been read
+        :return float:
+        """
+        return monotonic() - self._timestamp
+
+    @property
+    def error(self):
+        return self._error
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __contains__(self, key):
+        return key in self._values
+
+
+class TelemetryWorker(object):
+    """
+    Polls a set of Redis keys on a background thread and publishes the
+    result as a TelemetrySnapshot, so readers never wait for Redis.
+    Reads go through the snapshot cache of the connection pool, sharing
+    their round trip with every other reader of that cache. With
+    notifications enabled the keys are only read once they have changed
+    (see ValueSubscriber); if the server does not send keyspace
+    notifications the worker falls back to polling.
+    """
+
+    def __init__(self, r, keys=None, interval=TELEMETRY_INTERVAL, notifications=NOTIFY_OFF):
+        """
+        :param Redis r: Redis instance
+        :param list of str keys: Keys to poll
+        :param float interval: Seconds between two reads
+        :param str notifications: NOTIFY_OFF, NOTIFY_KEYSPACE or NOTIFY_CHANNEL
+        """
+        self._redis = r
+        self._keys = []
+        self._keys_lock = Lock()
+        self._interval = interval
+        self._decoder = SnapshotDecoder()
+        self._subscriber = None
+        if notifications != NOTIFY_OFF:
+            self._subscriber = ValueSubscriber(r, notifications, timeout=interval)
+        self._snapshot = TelemetrySnapshot()
+        self._stop_event = Event()
+        self._thread = None
+        if keys:
+            self.watch(keys)
+
+    @property
+    def snapshot(self):
+        """
+        Latest snapshot, never blocks
+        :return TelemetrySnapshot:
+        """
+        return self._snapshot
+
+    @property
+    def is_subscribed(self):
+        """
+        True unless the worker polls the keys
+        :return bool:
+        """
+        return self._subscriber is not None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def watch(self, keys):
+        """
+        Adds keys to the set of polled keys
+        :param list of str keys:
+        """
+        with self._keys_lock:
+            self._keys = self._keys + [key for key in keys if key not in self._keys]
+        if self._subscriber:
+            self._subscriber.watch(keys)
+
+    def start(self):
+        if self.is_running:
+            return
+        self._stop_event.clear()
+        self._thread = Thread(target=self._run, name='TelemetryWorker', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def poll(self):
+        """
+        Reads all watched keys once and publishes the result. Values
+        read by another client of the cache within its TTL are reused.
+        :return TelemetrySnapshot:
+        """
+        keys = self._keys
+        if not keys:
+            # Nothing watched yet, a snapshot of no values would read as
+            # state None instead of the initial one
+            return self._snapshot
+        try:
+            values = get_snapshot_cache(self._redis).get(keys)
+            snapshot = TelemetrySnapshot(values, decoded=self._decoder.decode(values))
+        except Exception as e:
+            log('Failed to read telemetry: {}'.format(e))
+            snapshot = TelemetrySnapshot(error=e)
+        self._snapshot = snapshot
+        return snapshot
+
+    def _on_change(self, values):
+        self._snapshot = TelemetrySnapshot(values, decoded=self._decoder.decode(values))
+
+    def _subscribe(self):
+        """
+        Listens for changes until stopped or failed
+        :return bool: False once the worker has to fall back to polling
+        """
+        try:
+            if self._subscriber.run(self._stop_event, self._on_change):
+                return True
+            log('Keyspace notifications are disabled, falling back to polling')
+            self._subscriber = None
+            return False
+        except Exception as e:
+            log('Telemetry subscription failed: {}'.format(e))
+            self._snapshot = TelemetrySnapshot(error=e)
+            self._stop_event.wait(self._interval)
+            return True
+
+    def _run(self):
+        while self._subscriber and not self._stop_event.is_set():
+            if not self._subscribe():
+                break
+        while not self._stop_event.is_set():
+            started = monotonic()
+            self.poll()
+            self._stop_event.wait(max(0.0, self._interval - (monotonic() - started)))